@@ -0,0 +1,291 @@
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from PIL import Image
+
+from inference import IMG_EXTENSIONS, build_model, make_transforms
+
+SUITES = ("render", "phrases", "decode", "inference")
+
+
+class RendererUnavailable(RuntimeError):
+    """The renderer could not be started here (no Chromium, no network for Google Fonts)."""
+
+
+def timed(fn, iters: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "cuda": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
+    }
+
+
+def bench_render(font_dir: Optional[str], phrases: List[str], samples: int, batch_size: int,
+                 num_fonts: int, seed: int = 0) -> Tuple[Dict, List[bytes]]:
+    """Samples/sec of render_font_sample (one capture per sample) and of render_batch.
+
+    Only a failure to start the renderer raises RendererUnavailable; errors while rendering
+    propagate, so a broken renderer fails the run instead of being skipped.
+    """
+    from render_dataset import make_generator
+
+    generator = make_generator(font_dir)
+    fonts = generator.get_google_fonts(num_fonts)
+    try:
+        generator.start_browser(fonts)
+    except Exception as e:
+        generator.stop_browser()
+        message = str(e).splitlines()[0] if str(e) else ""
+        raise RendererUnavailable(f"{type(e).__name__}: {message}") from e
+    results, pngs = {}, []
+    try:
+        rng = random.Random(seed)
+        jobs = [(rng.choice(phrases), fonts[i % len(fonts)]) for i in range(samples)]
+        generator.render_font_sample(*jobs[0], rng)  # warmup: font loading, first paint
+        t0 = time.perf_counter()
+        for text, font in jobs:
+            pngs.append(generator.render_font_sample(text, font, rng))
+        results["render.single"] = {"samples_per_sec": samples / (time.perf_counter() - t0)}
+
+        if batch_size > 1:
+            items = [(text, font, generator.sample_layout(text, rng)) for text, font in jobs]
+            t0 = time.perf_counter()
+            for i in range(0, len(items), batch_size):
+                generator.render_batch(items[i:i + batch_size])
+            results[f"render.batch{batch_size}"] = {"samples_per_sec": samples / (time.perf_counter() - t0)}
+    finally:
+        generator.stop_browser()
+    renderer = "local" if font_dir else "browser"
+    for r in results.values():
+        r["renderer"] = renderer
+    return results, pngs
+
+
+def bench_phrases(n: int, workers: List[int]) -> Dict:
+    from create_phrases import iter_phrases
+
+    results = {}
+    for w in workers:
+        t0 = time.perf_counter()
+        count = sum(1 for _ in iter_phrases(n, workers=w))
+        results[f"phrases.workers{w}"] = {"phrases_per_sec": count / (time.perf_counter() - t0)}
+    return results
+
+
+def bench_decode(images: List[bytes], img_size: int, in_channels: int) -> Dict:
+    """Single-thread PNG decode + transform rate for the eval and training transforms."""
+    from train import make_train_transforms
+
+    results = {}
+    for name, tfms in (("eval", make_transforms(img_size, in_channels)),
+                       ("train", make_train_transforms(img_size, in_channels))):
+        def run():
+            for data in images:
+                with Image.open(io.BytesIO(data)) as img:
+                    tfms(img.convert("RGB"))
+
+        elapsed = min(timed(run, iters=3))
+        results[f"decode.{name}"] = {"images_per_sec": len(images) / elapsed}
+    return results
+
+
+def bench_inference(devices: List[str], threads: List[int], batch_sizes: List[int], img_size: int,
+                    in_channels: int, num_classes: int, iters: int, channels_last: bool = False) -> Dict:
+    """Latency and throughput of a randomly initialized build_model per device/threads/batch size."""
+    results = {}
+    torch.manual_seed(0)
+    default_threads = torch.get_num_threads()
+    for device_name in devices:
+        device = torch.device(device_name)
+        model = build_model(num_classes, in_channels=in_channels).to(device).eval()
+        if channels_last:
+            model = model.to(memory_format=torch.channels_last)
+        # Thread counts only apply to the CPU; accelerators get one pass with the default
+        for n_threads in (dict.fromkeys(t or default_threads for t in threads) if device.type == "cpu"
+                          else [default_threads]):
+            torch.set_num_threads(n_threads)
+            for bs in batch_sizes:
+                x = torch.randn(bs, in_channels, img_size, img_size, device=device)
+                if channels_last:
+                    x = x.contiguous(memory_format=torch.channels_last)
+
+                def run():
+                    with torch.no_grad():
+                        model(x)
+                    if device.type == "cuda":
+                        torch.cuda.synchronize()
+
+                lat = statistics.median(timed(run, iters, warmup=2))
+                key = f"inference.{device.type}.threads{n_threads}.bs{bs}"
+                results[key] = {"latency_ms": lat * 1000, "images_per_sec": bs / lat}
+    torch.set_num_threads(default_threads)
+    return results
+
+
+def higher_is_better(metric: str) -> Optional[bool]:
+    if metric.endswith("_per_sec"):
+        return True
+    if metric.endswith("_ms"):
+        return False
+    return None
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Print current vs baseline for every numeric baseline metric of the suites that ran; return
+    the regressions. A metric missing from this run, or skipped in it, counts as a regression."""
+    regressions = []
+    current = results["results"]
+    suites = set(results.get("suites", SUITES))
+    print(f"\n{'benchmark':36s} {'metric':16s} {'baseline':>12s} {'current':>12s} {'change':>8s}")
+    for key in sorted(baseline["results"]):
+        suite = key.split(".")[0]
+        if suite not in suites:
+            continue
+        skipped = current.get(suite, {}).get("skipped") or current.get(key, {}).get("skipped")
+        for metric, old in baseline["results"][key].items():
+            better = higher_is_better(metric)
+            if better is None or not isinstance(old, (int, float)):
+                continue
+            value = current.get(key, {}).get(metric)
+            if not isinstance(value, (int, float)):
+                reason = f"skipped ({skipped})" if skipped else "missing"
+                print(f"{key:36s} {metric:16s} {old:12.2f} {'-':>12s} {'':8s} REGRESSION: {reason}")
+                regressions.append(f"{key} {metric}: {reason} in this run")
+                continue
+            change = value / old - 1
+            worse = -change if better else change
+            flag = "REGRESSION" if worse > tolerance else ("improved" if -worse > tolerance else "")
+            print(f"{key:36s} {metric:16s} {old:12.2f} {value:12.2f} {change:+8.1%} {flag}")
+            if flag == "REGRESSION":
+                regressions.append(f"{key} {metric}: {old:.2f} -> {value:.2f} ({change:+.1%})")
+    env, old_env = results["env"], baseline.get("env", {})
+    differs = [k for k in ("machine", "processor", "cpus", "torch", "cuda") if env.get(k) != old_env.get(k)]
+    if differs:
+        print(f"note: baseline was recorded on a different setup ({', '.join(differs)})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rendering, phrase generation, decoding and inference")
+    parser.add_argument("--suites", type=str, default=",".join(SUITES), help=f"Comma-separated subset of {SUITES}")
+    parser.add_argument("--output", type=Path, default=Path("benchmark.json"), help="Write results JSON here")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="Results JSON to compare against; exits non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown allowed before a metric counts as a regression")
+    parser.add_argument("--font-dir", type=str, default=None,
+                        help="Benchmark the Pillow renderer on these fonts (default: the browser renderer)")
+    parser.add_argument("--num-fonts", type=int, default=4)
+    parser.add_argument("--phrases", type=str, default="phrases_10000.csv")
+    parser.add_argument("--render-samples", type=int, default=200)
+    parser.add_argument("--render-batch", type=int, default=16, help="Items per render_batch call")
+    parser.add_argument("--phrase-count", type=int, default=200_000)
+    parser.add_argument("--phrase-workers", type=str, default="1")
+    parser.add_argument("--data", type=Path, default=None,
+                        help="Image directory for the decode suite (default: the rendered samples)")
+    parser.add_argument("--decode-images", type=int, default=200)
+    parser.add_argument("--devices", type=str, default="cpu", help="Comma-separated, e.g. cpu,cuda")
+    parser.add_argument("--threads", type=str, default="1,0", help="CPU thread counts (0 = torch default)")
+    parser.add_argument("--batch-sizes", type=str, default="1,8,32")
+    parser.add_argument("--iters", type=int, default=10)
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--channels", type=int, choices=[1, 3], default=3)
+    parser.add_argument("--num-classes", type=int, default=13)
+    parser.add_argument("--channels-last", action="store_true")
+    args = parser.parse_args()
+
+    suites = [s for s in args.suites.split(",") if s]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise SystemExit(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+    results = {"env": environment(), "suites": suites, "results": {}}
+    pngs = []
+
+    if "render" in suites or ("decode" in suites and args.data is None):
+        from create_phrases import read_phrases
+
+        phrases = list(read_phrases(args.phrases))
+        try:
+            rendered, pngs = bench_render(args.font_dir, phrases, args.render_samples, args.render_batch,
+                                          args.num_fonts)
+        except RendererUnavailable as e:
+            # No Chromium/network here; recorded, and a regression against a baseline that has it
+            print(f"render: skipped ({e})", file=sys.stderr)
+            results["results"]["render"] = {"skipped": str(e)}
+        else:
+            if "render" in suites:
+                results["results"].update(rendered)
+
+    if "phrases" in suites:
+        results["results"].update(bench_phrases(args.phrase_count, [int(w) for w in args.phrase_workers.split(",")]))
+
+    if "decode" in suites:
+        if args.data is not None:
+            paths = sorted(p for p in args.data.rglob("*") if p.suffix.lower() in IMG_EXTENSIONS)
+            pngs = [p.read_bytes() for p in paths[:args.decode_images]]
+        if pngs:
+            results["results"].update(bench_decode(pngs[:args.decode_images], args.img_size, args.channels))
+        else:
+            results["results"]["decode"] = {"skipped": "no images; pass --data or a working renderer"}
+
+    if "inference" in suites:
+        results["results"].update(bench_inference(
+            args.devices.split(","), [int(t) for t in args.threads.split(",")],
+            [int(b) for b in args.batch_sizes.split(",")], args.img_size, args.channels, args.num_classes,
+            args.iters, args.channels_last))
+
+    for key, metrics in results["results"].items():
+        print(f"{key:36s} " + "  ".join(f"{m}={v:.2f}" if isinstance(v, float) else f"{m}={v}"
+                                         for m, v in metrics.items()))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
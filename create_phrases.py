@@ -1,10 +1,18 @@
-# Generate 10,000 phrases with MUCH greater sentence variety (and mixed capitalization for single words)
-# Saves to: phrases_10000_varied_caps.csv
+# Streaming phrase corpus generator: single words (mixed capitalization), varied sentences and
+# short paragraphs. `python create_phrases.py` writes the default 10,000-phrase phrases_10000.csv;
+# import iter_phrases() to stream millions of phrases without materializing them.
+import argparse
+import csv
+import os
 import random
-import pandas as pd
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, timedelta
-
-random.seed(42)
+from itertools import accumulate
+from pathlib import Path
+from string import Formatter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 # === Lexicons ===
 adjs = [
@@ -57,140 +65,337 @@ hobbies = [
 
 connectors = ["and","but","so","because","while","although","therefore","however","meanwhile","instead"]
 
-# === Helpers ===
-def vary_capitalization(word: str) -> str:
-    r = random.random()
-    if r < 0.7:
-        return word.lower()
-    elif r < 0.9:
-        return word.title()
-    else:
-        return word.upper()
+words = adjs + nouns
+chores = ["breathe","hydrate","stretch","back up your files","take a break"]
+settings = ["the city","the countryside","a small studio","a busy kitchen"]
+projects = ["Aurora","Nimbus","Echo","Vega","Delta"]
+vantages = ["balcony","shore","ridge","window"]
+statuses = ["open","pending","closed"]
+openers = ["Sometimes","Often","Now and then","From time to time"]
+observers = ["I notice","we find","people say","it seems"]
 
+# === Helpers ===
 def a_an(word: str) -> str:
     return ("an " if word[0].lower() in "aeiou" else "a ") + word
 
-def rand_date():
-    d = date.today() - timedelta(days=random.randint(0, 365*3))
-    return d.strftime("%B %d, %Y")
+def list3(rng: random.Random, seq: Sequence[str]) -> str:
+    a, b, c = rng.sample(seq, 3)
+    return f"{a}, {b}, and {c}"
 
-def num(n1=1, n2=9999):
-    return random.randint(n1, n2)
+# === Templates ===
+# Slot fields are drawn once per phrase, so "{adj}—almost too {adj}" repeats the same word;
+# every other field is drawn fresh at each occurrence.
+SLOTS: Dict[str, List[str]] = {
+    "adj": adjs, "noun": nouns, "adv": adverbs, "place": places, "person": people,
+    "hobby": hobbies, "iv": verbs_itv, "tv": verbs_tv, "tspan": timespans,
+}
 
-def list3(seq):
-    a,b,c = random.sample(seq, 3)
-    return f"{a}, {b}, and {c}"
+FIELDS: Dict[str, Callable[["PhraseGenerator"], str]] = {
+    "Adj": lambda g: g.slot("adj").capitalize(),
+    "a_adj": lambda g: a_an(g.slot("adj")),
+    "a_noun": lambda g: a_an(g.slot("noun")),
+    "a_adj_noun": lambda g: a_an(g.slot("adj") + " " + g.slot("noun")),
+    "a_any_adj": lambda g: a_an(g.rng.choice(adjs)),
+    "any_noun": lambda g: g.rng.choice(nouns),
+    "any_adj": lambda g: g.rng.choice(adjs),
+    "any_iv": lambda g: g.rng.choice(verbs_itv),
+    "any_adv": lambda g: g.rng.choice(adverbs),
+    "connector": lambda g: g.rng.choice(connectors),
+    "date": lambda g: (g.today - timedelta(days=g.rng.randint(0, 365 * 3))).strftime("%B %d, %Y"),
+    "today": lambda g: g.today.isoformat(),
+    "hour": lambda g: str(g.rng.randint(1, 12)),
+    "minute": lambda g: str(g.rng.randint(0, 59)).zfill(2),
+    "pct": lambda g: str(g.rng.randint(5, 95)),
+    "few": lambda g: str(g.rng.randint(2, 9)),
+    "pages": lambda g: str(g.rng.randint(10, 99)),
+    "hobbies3": lambda g: list3(g.rng, hobbies),
+    "notes": lambda g: list3(g.rng, [a_an(g.slot("adj")), a_an(g.rng.choice(adjs)), a_an(g.rng.choice(adjs))]),
+    "chore": lambda g: g.rng.choice(chores),
+    "setting": lambda g: g.rng.choice(settings),
+    "project": lambda g: g.rng.choice(projects),
+    "vantage": lambda g: g.rng.choice(vantages),
+    "status": lambda g: g.rng.choice(statuses),
+    "ampm": lambda g: g.rng.choice(["AM", "PM"]),
+    "opener": lambda g: g.rng.choice(openers),
+    "observer": lambda g: g.rng.choice(observers),
+}
+
+class Template:
+    """A format string parsed once into (literal, field) parts."""
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.parts = []
+        for literal, name, _, _ in Formatter().parse(fmt):
+            if name is None:
+                field = None
+            elif name in SLOTS:
+                field = lambda g, name=name: g.slot(name)
+            elif name in FIELDS:
+                field = FIELDS[name]
+            else:
+                raise ValueError(f"Unknown field {{{name}}} in template {fmt!r}")
+            self.parts.append((literal, field))
+
+    def render(self, g: "PhraseGenerator") -> str:
+        g.slots = {}
+        return "".join(literal + field(g) if field else literal for literal, field in self.parts)
+
+SENTENCE_TEMPLATES = [Template(t) for t in [
+    "The {adj} {noun} {iv} {place} {tspan}.",
+    "I love {hobby} because it feels {adj} {adv}.",
+    "{Adj} ideas {iv} when the {noun} is quiet.",
+    "Remember to {chore} {tspan}.",
+    "In {setting}, the {noun} {iv} {adv}.",
+    "Why does the {noun} seem so {adj} {tspan}?",
+    "{person} {tv}s {a_adj_noun} {place}.",
+    "On {date}, we noted that the {noun} {iv} {adv}.",
+    "{person} asked, \"Can the {noun} really {iv}?\"",
+    "Please {tv} the {noun} {tspan}; it's {adj} {place}.",
+    "{person} {iv} {adv}, and the {noun} stayed {adj}.",
+    "After {hobby}, the {noun} {iv} as if it knew {person}.",
+    "\"{Adj} or not,\" {person} said, \"the {noun} must {tv}.\"",
+    "The {noun} was {adj}—almost too {adj}—when {person} arrived.",
+    "If the {noun} {iv} {adv}, {person} will {tv} it.",
+    "Because the {noun} was {adj}, we decided to {tv} it {tspan}.",
+    "{person} prefers {hobbies3} on slow days.",
+    "Between {date} and {date}, the {noun} {iv} repeatedly.",
+    "Is the {noun} {adj} enough to {tv} safely?",
+    "Whenever it rains, the {noun} {iv} {place}.",
+    "Nobody expected the {noun} to {iv} so {adv}.",
+    "Surprisingly, the {noun} {iv} while {person} {tv}ed something else.",
+    "The plan was simple: {tv} the {noun}, review the results, and rest.",
+    "At exactly {hour}:{minute}, the {noun} finally {iv}.",
+    "{person} found {a_adj} {noun} and called it \"Project {project}\".",
+    "The {noun} (which was unusually {adj}) {iv} without warning.",
+    "First we {tv} the {noun}, then we {tv} the data, instead we shared the report.",
+    "It was not just {a_adj} {noun}; it was {a_any_adj} revelation.",
+    "Most days the {noun} {iv} {tspan}, but today it stalled.",
+    "Against expectations, {person} kept the {noun} {adj} and steady.",
+    "The {noun} seems {adj}; still, we should {tv} it carefully.",
+    "From the {vantage}, the {noun} {iv} like a memory.",
+    "Without a doubt, {person} can {tv} {a_noun} in minutes.",
+    "Let the {noun} {iv} {adv}, then begin to {tv}.",
+    "Statistically speaking, {pct}% of {noun}s {iv} {tspan}.",
+    "I keep wondering whether the {noun} will {iv} again tomorrow.",
+    "Only after {date} did we realize the {noun} was {adj}.",
+    "Notes: {notes}; status: {status}.",
+    "Short checklist: {tv} data; verify {noun}; document findings.",
+    "The {noun} {iv}, so nobody noticed.",
+    "Had the {noun} {iv} earlier, {person} might have left.",
+    "Some say the {noun} {iv} only {place}.",
+    "Over time, the {noun} became more {adj} and less fragile.",
+    "By design, the {noun} {iv} when temperatures drop.",
+    "Could {person} {tv} the {noun} before sunset?",
+    "After a pause, the {noun} resumed and {iv} twice.",
+    "The {noun} didn't {iv}; it waited.",
+    "To be fair, {person} warned us the {noun} was {adj}.",
+    "Curiously, the {noun} {iv} exactly at noon.",
+    "Nothing about the {noun} felt {adj} until {person} arrived.",
+    "In theory the {noun} should {iv}; in practice, it stalls.",
+    "With patience and light, the {noun} will {iv} again.",
+    "Tomorrow at {hour}:{minute} {ampm}, we {tv} the {noun}.",
+    "Even {person} admits the {noun} {iv} better {place}.",
+    "The {noun} is {adj} enough to {tv} quietly.",
+    "Set the {noun} down, breathe, and watch it {iv}.",
+    "Oddly specific: {few} samples, {pages} pages, 1 {noun}.",
+    "One step at a time, the {noun} will {iv} to completion.",
+    "Without {person}, the {noun} rarely {iv} correctly.",
+    "At first glance, the {noun} looked {adj}—on closer look, still {adj}.",
+]]
+
+PARAGRAPH_FOLLOWUP = Template(
+    "{opener}, {observer} that the {any_noun} {any_iv} {any_adv} {connector} the {any_noun} stays {any_adj}.")
+PARAGRAPH_CLOSER = Template(
+    "On {today}, I wrote this down to remember that small details can be {any_adj}.")
 
 # === Generators ===
-def make_word(_):
-    # Always single token (no hyphen), but with varied capitalization
-    return vary_capitalization(random.choice(adjs + nouns))
-
-def make_sentence(_):
-    # A large and varied set of templates
-    subj_n = random.choice(nouns)
-    adj = random.choice(adjs)
-    adv = random.choice(adverbs)
-    pl = random.choice(places)
-    pers = random.choice(people)
-    hob = random.choice(hobbies)
-    iv = random.choice(verbs_itv)
-    tv = random.choice(verbs_tv)
-    tspan = random.choice(timespans)
-
-    templates = [
-        lambda: f"The {adj} {subj_n} {iv} {pl} {tspan}.",
-        lambda: f"I love {hob} because it feels {adj} {adv}.",
-        lambda: f"{adj.capitalize()} ideas {iv} when the {subj_n} is quiet.",
-        lambda: f"Remember to {random.choice(['breathe','hydrate','stretch','back up your files','take a break'])} {tspan}.",
-        lambda: f"In {random.choice(['the city','the countryside','a small studio','a busy kitchen'])}, the {subj_n} {iv} {adv}.",
-        lambda: f"Why does the {subj_n} seem so {adj} {tspan}?",
-        lambda: f"{pers} {tv}s {a_an(adj + ' ' + subj_n)} {pl}.",
-        lambda: f"On {rand_date()}, we noted that the {subj_n} {iv} {adv}.",
-        lambda: f"{pers} asked, \"Can the {subj_n} really {iv}?\"",
-        lambda: f"Please {tv} the {subj_n} {tspan}; it's {adj} {pl}.",
-        lambda: f"{pers} {iv} {adv}, {connectors[0]} the {subj_n} stayed {adj}.",
-        lambda: f"After {hob}, the {subj_n} {iv} as if it knew {pers}.",
-        lambda: f"\"{adj.capitalize()} or not,\" {pers} said, \"the {subj_n} must {tv}.\"",
-        lambda: f"The {subj_n} was {adj}—almost too {adj}—when {pers} arrived.",
-        lambda: f"If the {subj_n} {iv} {adv}, {pers} will {tv} it.",
-        lambda: f"Because the {subj_n} was {adj}, we decided to {tv} it {tspan}.",
-        lambda: f"{pers} prefers {list3(hobbies)} on slow days.",
-        lambda: f"Between {rand_date()} and {rand_date()}, the {subj_n} {iv} repeatedly.",
-        lambda: f"Is the {subj_n} {adj} enough to {tv} safely?",
-        lambda: f"Whenever it rains, the {subj_n} {iv} {pl}.",
-        lambda: f"Nobody expected the {subj_n} to {iv} so {adv}.",
-        lambda: f"Surprisingly, the {subj_n} {iv} while {pers} {tv}ed something else.",
-        lambda: f"The plan was simple: {tv} the {subj_n}, review the results, and rest.",
-        lambda: f"At exactly {num(1,12)}:{str(num(0,59)).zfill(2)}, the {subj_n} finally {iv}.",
-        lambda: f"{pers} found {a_an(adj)} {subj_n} and called it \"Project {random.choice(['Aurora','Nimbus','Echo','Vega','Delta'])}\".",
-        lambda: f"The {subj_n} (which was unusually {adj}) {iv} without warning.",
-        lambda: f"First we {tv} the {subj_n}, then we {tv} the data, {connectors[-1]} we shared the report.",
-        lambda: f"It was not just {a_an(adj)} {subj_n}; it was {a_an(random.choice(adjs))} revelation.",
-        lambda: f"Most days the {subj_n} {iv} {tspan}, {connectors[1]} today it stalled.",
-        lambda: f"Against expectations, {pers} kept the {subj_n} {adj} and steady.",
-        lambda: f"The {subj_n} seems {adj}; still, we should {tv} it carefully.",
-        lambda: f"From the {random.choice(['balcony','shore','ridge','window'])}, the {subj_n} {iv} like a memory.",
-        lambda: f"Without a doubt, {pers} can {tv} {a_an(subj_n)} in minutes.",
-        lambda: f"Let the {subj_n} {iv} {adv}, then begin to {tv}.",
-        lambda: f"Statistically speaking, {num(5,95)}% of {subj_n}s {iv} {tspan}.",
-        lambda: f"I keep wondering whether the {subj_n} will {iv} again tomorrow.",
-        lambda: f"Only after {rand_date()} did we realize the {subj_n} was {adj}.",
-        lambda: f"Notes: {list3([a_an(adj), a_an(random.choice(adjs)), a_an(random.choice(adjs))])}; status: {random.choice(['open','pending','closed'])}.",
-        lambda: f"Short checklist: {tv} data; verify {subj_n}; document findings.",
-        lambda: f"The {subj_n} {iv}, {connectors[2]} nobody noticed.",
-        lambda: f"Had the {subj_n} {iv} earlier, {pers} might have left.",
-        lambda: f"Some say the {subj_n} {iv} only {pl}.",
-        lambda: f"Over time, the {subj_n} became more {adj} and less fragile.",
-        lambda: f"By design, the {subj_n} {iv} when temperatures drop.",
-        lambda: f"Could {pers} {tv} the {subj_n} before sunset?",
-        lambda: f"After a pause, the {subj_n} resumed and {iv} twice.",
-        lambda: f"The {subj_n} didn't {iv}; it waited.",
-        lambda: f"To be fair, {pers} warned us the {subj_n} was {adj}.",
-        lambda: f"Curiously, the {subj_n} {iv} exactly at noon.",
-        lambda: f"Nothing about the {subj_n} felt {adj} until {pers} arrived.",
-        lambda: f"In theory the {subj_n} should {iv}; in practice, it stalls.",
-        lambda: f"With patience and light, the {subj_n} will {iv} again.",
-        lambda: f"Tomorrow at {num(1,12)}:{str(num(0,59)).zfill(2)} {random.choice(['AM','PM'])}, we {tv} the {subj_n}.",
-        lambda: f"Even {pers} admits the {subj_n} {iv} better {pl}.",
-        lambda: f"The {subj_n} is {adj} enough to {tv} quietly.",
-        lambda: f"Set the {subj_n} down, breathe, and watch it {iv}.",
-        lambda: f"Oddly specific: {num(2,9)} samples, {num(10,99)} pages, 1 {subj_n}.",
-        lambda: f"One step at a time, the {subj_n} will {iv} to completion.",
-        lambda: f"Without {pers}, the {subj_n} rarely {iv} correctly.",
-        lambda: f"At first glance, the {subj_n} looked {adj}—on closer look, still {adj}.",
-    ]
-
-    return random.choice(templates)()
-
-def make_paragraph(_):
-    s1 = make_sentence(_)
-    s2 = (
-        f"{random.choice(['Sometimes','Often','Now and then','From time to time']).capitalize()}, "
-        f"{random.choice(['I notice','we find','people say','it seems'])} that the {random.choice(nouns)} "
-        f"{random.choice(verbs_itv)} {random.choice(adverbs)} {random.choice(connectors)} the "
-        f"{random.choice(nouns)} stays {random.choice(adjs)}."
-    )
-    s3 = f"On {date.today().isoformat()}, I wrote this down to remember that small details can be {random.choice(adjs)}."
-    return " ".join([s1, s2]) if random.random() < 0.5 else " ".join([s1, s2, s3])
-
-# === Build dataset ===
-N_WORDS, N_SENT, N_PARA = 3000, 5000, 2000
-phrases, types = [], []
-
-for i in range(N_WORDS):
-    phrases.append(make_word(i)); types.append("word")
-for i in range(N_SENT):
-    phrases.append(make_sentence(i)); types.append("sentence")
-for i in range(N_PARA):
-    phrases.append(make_paragraph(i)); types.append("paragraph")
-
-combined = list(zip(types, phrases))
-random.shuffle(combined)
-types, phrases = zip(*combined)
-
-df = pd.DataFrame({"type": types, "phrase": phrases})
-df.to_csv("./phrases_10000.csv", index=False)
-
-print("Saved to phrases_10000.csv")
-print(df.head(10))
+KINDS = ("word", "sentence", "paragraph")
+DEFAULT_WEIGHTS = (0.3, 0.5, 0.2)  # the original 3000/5000/2000 split
+
+class PhraseGenerator:
+    """Draws words, sentences and paragraphs from one seeded random stream."""
+
+    def __init__(self, seed=None, today: Optional[date] = None,
+                 template_weights: Optional[Sequence[float]] = None):
+        self.rng = random.Random(seed)
+        self.today = today or date.today()
+        self.slots: Dict[str, str] = {}
+        self.cum_template_weights = None
+        if template_weights is not None:
+            if len(template_weights) != len(SENTENCE_TEMPLATES):
+                raise ValueError(f"Expected {len(SENTENCE_TEMPLATES)} template weights, got {len(template_weights)}")
+            self.cum_template_weights = list(accumulate(template_weights))
+
+    def slot(self, name: str) -> str:
+        if name not in self.slots:
+            self.slots[name] = self.rng.choice(SLOTS[name])
+        return self.slots[name]
+
+    def word(self) -> str:
+        # Always single token (no hyphen), but with varied capitalization
+        w = self.rng.choice(words)
+        r = self.rng.random()
+        if r < 0.7:
+            return w.lower()
+        elif r < 0.9:
+            return w.title()
+        return w.upper()
+
+    def sentence(self) -> str:
+        if self.cum_template_weights is None:
+            template = self.rng.choice(SENTENCE_TEMPLATES)
+        else:
+            template = self.rng.choices(SENTENCE_TEMPLATES, cum_weights=self.cum_template_weights)[0]
+        return template.render(self)
+
+    def paragraph(self) -> str:
+        parts = [self.sentence(), PARAGRAPH_FOLLOWUP.render(self)]
+        if self.rng.random() >= 0.5:
+            parts.append(PARAGRAPH_CLOSER.render(self))
+        return " ".join(parts)
+
+    def phrases(self, counts: Dict[str, int]) -> Iterator[Tuple[str, str]]:
+        """Exactly counts[kind] phrases of each kind, in uniformly shuffled order, drawn lazily."""
+        remaining = [counts.get(kind, 0) for kind in KINDS]
+        make = [self.word, self.sentence, self.paragraph]
+        total = sum(remaining)
+        while total:
+            # Pick the next kind in proportion to what is left: a shuffle without a buffer
+            r = self.rng.randrange(total)
+            k = 0
+            while r >= remaining[k]:
+                r -= remaining[k]
+                k += 1
+            remaining[k] -= 1
+            total -= 1
+            yield KINDS[k], make[k]()
+
+def split_counts(n: int, weights: Sequence[float] = DEFAULT_WEIGHTS) -> Dict[str, int]:
+    """Largest-remainder split of n phrases over KINDS by weight."""
+    total = sum(weights)
+    exact = [n * w / total for w in weights]
+    counts = [int(x) for x in exact]
+    for k in sorted(range(len(KINDS)), key=lambda k: exact[k] - counts[k], reverse=True)[:n - sum(counts)]:
+        counts[k] += 1
+    return dict(zip(KINDS, counts))
+
+def _generate_shard(spec) -> List[Tuple[str, str]]:
+    seed, shard, size, weights, today, template_weights = spec
+    g = PhraseGenerator(f"{seed}:{shard}", today, template_weights)
+    return list(g.phrases(split_counts(size, weights)))
+
+def iter_phrases(n: int = 10000, weights: Sequence[float] = DEFAULT_WEIGHTS, seed=42,
+                 shard_size: int = 100_000, workers: int = 1, today: Optional[date] = None,
+                 template_weights: Optional[Sequence[float]] = None) -> Iterator[Tuple[str, str]]:
+    """Stream n (type, phrase) pairs in shards of shard_size.
+
+    Shard i draws from its own generator seeded with f"{seed}:{i}", so the stream is the same
+    for any number of worker processes. seed=None picks a fresh seed.
+    """
+    if seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+    today = today or date.today()
+    specs = ((seed, i, min(shard_size, n - start), tuple(weights), today, template_weights)
+             for i, start in enumerate(range(0, n, shard_size)))
+
+    if workers <= 1:
+        for seed_, shard, size, weights_, today_, tw in specs:
+            yield from PhraseGenerator(f"{seed_}:{shard}", today_, tw).phrases(split_counts(size, weights_))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of shards in flight and yield them in order
+        pending = deque()
+        for spec in specs:
+            pending.append(pool.submit(_generate_shard, spec))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# === Output ===
+def write_phrases(phrases: Iterable[Tuple[str, str]], path: Path, chunk_size: int = 100_000) -> int:
+    """Write (type, phrase) pairs to .csv or .parquet in chunks of chunk_size rows; returns the count."""
+    path = Path(path)
+    count = 0
+    if path.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([("type", pa.string()), ("phrase", pa.string())])
+        with pq.ParquetWriter(str(path), schema) as writer:
+            chunk = []
+            for row in phrases:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*chunk)], schema=schema))
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                writer.write_table(pa.Table.from_arrays([list(c) for c in zip(*chunk)], schema=schema))
+                count += len(chunk)
+        return count
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["type", "phrase"])
+        chunk = []
+        for row in phrases:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.writerows(chunk)
+                count += len(chunk)
+                chunk = []
+        writer.writerows(chunk)
+        count += len(chunk)
+    return count
+
+def read_phrases(path: Path) -> Iterator[str]:
+    """Stream the phrase column of a .csv or .parquet phrase file."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(str(path)).iter_batches(columns=["phrase"]):
+            yield from batch.column(0).to_pylist()
+        return
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield row["phrase"]
+
+def bench(n: int, workers: Sequence[int], shard_size: int, seed=42):
+    """Generation throughput (phrases/sec) for each worker count."""
+    for w in workers:
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_phrases(n, seed=seed, shard_size=shard_size, workers=w))
+        elapsed = time.perf_counter() - start
+        print(f"workers={w:3d}: {count} phrases in {elapsed:.2f}s ({count / elapsed:,.0f} phrases/sec)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a phrase corpus for rendering")
+    parser.add_argument("--n", type=int, default=10000, help="Number of phrases")
+    parser.add_argument("--weights", type=str, default=",".join(map(str, DEFAULT_WEIGHTS)),
+                        help="word,sentence,paragraph mix")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="Generator processes")
+    parser.add_argument("--shard-size", type=int, default=100_000, help="Phrases per deterministically seeded shard")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Rows per CSV write / Parquet row group")
+    parser.add_argument("--output", type=Path, default=Path("phrases_10000.csv"), help=".csv or .parquet")
+    parser.add_argument("--bench", type=str, default=None, metavar="WORKERS",
+                        help="Only measure generation throughput for these worker counts, e.g. 1,4,8")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.n, [int(w) for w in args.bench.split(",")], args.shard_size, args.seed)
+        return
+
+    weights = [float(w) for w in args.weights.split(",")]
+    start = time.perf_counter()
+    count = write_phrases(iter_phrases(args.n, weights, args.seed, args.shard_size, args.workers),
+                          args.output, args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Saved {count} phrases to {args.output} in {elapsed:.1f}s ({count / elapsed:,.0f} phrases/sec)")
+
+if __name__ == "__main__":
+    main()
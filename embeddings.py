@@ -0,0 +1,368 @@
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import DataLoader, Subset
+
+from inference import get_device, input_channels, load_model, make_transforms
+from prediction_cache import checkpoint_digest
+
+META_FILE = "index.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+DTYPES = ("float16", "int8")
+
+
+class FeatureExtractor(nn.Module):
+    """L2-normalized penultimate (global average pool) features of a ResNet classifier."""
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.in_channels = input_channels(model)
+        self.dim = model.fc.in_features
+        # Everything up to and including avgpool; the classifier head is dropped
+        self.body = nn.Sequential(*list(model.children())[:-1])
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.normalize(self.body(x).flatten(1), dim=1)
+
+
+def embed(extractor: nn.Module, batch: torch.Tensor, device: torch.device) -> torch.Tensor:
+    if device.type == "cuda":
+        batch = batch.pin_memory()
+    with torch.no_grad():
+        return extractor(batch.to(device, non_blocking=True)).float().cpu()
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """float16 rows, or int8 rows with a float32 scale per row (symmetric, max-abs)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class FontIndex:
+    """Per-font prototype embeddings, memory-mapped for top-k cosine search.
+
+    index.json holds the dimension, storage dtype, checkpoint digest and one class name per row;
+    vectors.bin holds the rows (float16, or int8 with a float32 scale per row in scales.bin).
+    add() appends to the .bin files and rewrites index.json last, so an interrupted add leaves
+    the index as it was. A font may have several rows; search returns its best one.
+    """
+
+    def __init__(self, root: Path, cache: bool = True):
+        self.root = Path(root)
+        with open(self.root / META_FILE) as f:
+            self.meta = json.load(f)
+        self.dim = self.meta["dim"]
+        self.dtype = self.meta["dtype"]
+        # cache=False dequantizes from the memmap chunk by chunk on every search instead of
+        # keeping a float32 copy, for indexes larger than memory
+        self.cache = cache
+        self._load()
+
+    @classmethod
+    def create(cls, root: Path, dim: int, dtype: str = "float16", checkpoint: str = "",
+               img_size: int = 224) -> "FontIndex":
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}")
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        for name in (VECTORS_FILE, SCALES_FILE):
+            open(root / name, "wb").close()
+        cls._write_meta(root, {"dim": dim, "dtype": dtype, "checkpoint": checkpoint,
+                               "img_size": img_size, "classes": []})
+        return cls(root)
+
+    @staticmethod
+    def _write_meta(root: Path, meta: dict):
+        tmp = root / (META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, root / META_FILE)
+
+    def _load(self):
+        self.classes: List[str] = self.meta["classes"]
+        self.fonts = list(dict.fromkeys(self.classes))
+        font_ids = {font: i for i, font in enumerate(self.fonts)}
+        self.labels = np.array([font_ids[c] for c in self.classes], dtype=np.int64)
+        # Rows grouped by font, for the per-font max when fonts have several prototypes
+        self._order = np.argsort(self.labels, kind="stable")
+        self._starts = np.searchsorted(self.labels[self._order], np.arange(len(self.fonts)))
+        self._unique = len(self.fonts) == len(self.classes)
+        n = len(self.classes)
+        # Only the rows index.json counts are mapped; bytes from an interrupted add are ignored
+        self.vectors = (np.memmap(self.root / VECTORS_FILE, dtype=self.dtype, mode="r", shape=(n, self.dim))
+                        if n else np.zeros((0, self.dim), dtype=self.dtype))
+        self.scales = None
+        if self.dtype == "int8":
+            self.scales = (np.memmap(self.root / SCALES_FILE, dtype=np.float32, mode="r", shape=(n,))
+                           if n else np.zeros(0, dtype=np.float32))
+        self._dense = None
+
+    def __len__(self) -> int:
+        return len(self.classes)
+
+    def add(self, classes: Sequence[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(classes), self.dim):
+            raise ValueError(f"expected {len(classes)} vectors of dim {self.dim}, got {vectors.shape}")
+        rows, scales = quantize(vectors, self.dtype)
+        count = len(self.classes)
+        for name, data, itemsize in ((VECTORS_FILE, rows, rows.itemsize * self.dim),
+                                     (SCALES_FILE, scales, 4)):
+            if data is None:
+                continue
+            with open(self.root / name, "r+b") as f:
+                # Drop any tail left by an interrupted add before appending
+                f.truncate(count * itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.meta["classes"] = self.classes + list(classes)
+        self._write_meta(self.root, self.meta)
+        self._load()
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Dequantized float32 rows [start, stop)."""
+        rows = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            rows *= self.scales[start:stop, None]
+        return rows
+
+    def similarities(self, queries: np.ndarray, chunk_rows: int = 65536) -> np.ndarray:
+        """(B, num_fonts) cosine similarity of each query to each font's best prototype."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        if self.cache:
+            if self._dense is None:
+                self._dense = np.ascontiguousarray(self.rows())
+            scores = queries @ self._dense.T
+        else:
+            scores = np.empty((len(queries), len(self)), dtype=np.float32)
+            for start in range(0, len(self), chunk_rows):
+                scores[:, start:start + chunk_rows] = queries @ self.rows(start, start + chunk_rows).T
+        if not self._unique:
+            scores = np.maximum.reduceat(scores[:, self._order], self._starts, axis=1)
+        return scores
+
+    def search(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k fonts per query as (scores, font indices into self.fonts), both (B, k)."""
+        if not len(self):
+            raise ValueError(f"{self.root} is empty")
+        scores = self.similarities(queries)
+        k = min(k, scores.shape[1])
+        # Partial selection is O(num_fonts); only the k survivors are sorted
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def load_extractor(ckpt: Path, device: torch.device, in_channels: Optional[int] = None) -> FeatureExtractor:
+    model, _ = load_model(ckpt, device, in_channels=in_channels)
+    return FeatureExtractor(model).to(device).eval()
+
+
+def check_checkpoint(index: FontIndex, ckpt: Path):
+    expected = index.meta.get("checkpoint")
+    if expected and expected != checkpoint_digest(ckpt):
+        raise SystemExit(f"{index.root} was built with a different checkpoint than {ckpt}; "
+                         "rebuild it, since embeddings from other weights aren't comparable")
+
+
+def prototypes(extractor: nn.Module, batches: Iterable[Tuple[torch.Tensor, torch.Tensor]], num_classes: int,
+               device: torch.device) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean embedding per class, re-normalized, and the sample count per class."""
+    sums = None
+    counts = torch.zeros(num_classes, dtype=torch.long)
+    for batch, labels in batches:
+        feats = embed(extractor, batch, device)
+        if sums is None:
+            sums = torch.zeros(num_classes, feats.size(1))
+        sums.index_add_(0, labels, feats)
+        counts += torch.bincount(labels, minlength=num_classes)
+    if sums is None:
+        raise ValueError("no samples to build prototypes from")
+    return F.normalize(sums, dim=1).numpy(), counts.numpy()
+
+
+def source_batches(source: Path, transform, samples_per_class: int, batch_size: int, workers: int,
+                   seed: int = 0) -> Tuple[List[str], DataLoader]:
+    """Up to samples_per_class random samples of each class of an ImageFolder or shard directory."""
+    from tensor_cache import open_source
+
+    ds = open_source(source, transform=transform)
+    by_class = {}
+    for i, target in enumerate(ds.targets):
+        by_class.setdefault(target, []).append(i)
+    rng = random.Random(seed)
+    indices = sorted(i for members in by_class.values()
+                     for i in rng.sample(members, min(samples_per_class, len(members))))
+    return ds.classes, DataLoader(Subset(ds, indices), batch_size=batch_size, num_workers=workers)
+
+
+def render_batches(generator, fonts: Sequence[str], phrases: Sequence[str], samples_per_font: int, transform,
+                   batch_size: int, seed: int = 0) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+    """Fresh renders of each font, samples_per_font each, batched like a DataLoader."""
+    generator.start_browser(list(fonts))
+    direct = hasattr(generator, "render_layout_image")
+    tensors, labels = [], []
+    try:
+        for label, font in enumerate(fonts):
+            rng = random.Random(f"{seed}:{font}")
+            items = []
+            for _ in range(samples_per_font):
+                text = rng.choice(phrases)
+                items.append((text, font, generator.sample_layout(text, rng)))
+            if direct:
+                images = [generator.render_layout_image(*item) for item in items]
+            else:
+                images = [Image.open(io.BytesIO(png)) for png in generator.render_batch(items)]
+            for img in images:
+                tensors.append(transform(img.convert("RGB")))
+                labels.append(label)
+                if len(tensors) == batch_size:
+                    yield torch.stack(tensors), torch.tensor(labels)
+                    tensors, labels = [], []
+        if tensors:
+            yield torch.stack(tensors), torch.tensor(labels)
+    finally:
+        generator.stop_browser()
+
+
+def embed_fonts(args, extractor: nn.Module, device: torch.device, img_size: int) -> Tuple[List[str], np.ndarray]:
+    """(classes, prototypes) from --data or --render-fonts."""
+    transform = make_transforms(img_size, extractor.in_channels)
+    if args.render_fonts:
+        from create_phrases import read_phrases
+        from render_dataset import make_generator
+
+        generator = make_generator(args.font_dir)
+        fonts = args.render_fonts
+        if fonts == ["all"]:
+            fonts = generator.get_google_fonts(limit=None)
+        classes = [f.replace(' ', '_') for f in fonts]
+        batches = render_batches(generator, fonts, list(read_phrases(args.phrases)), args.samples_per_font,
+                                 transform, args.batch_size, args.seed)
+    else:
+        classes, batches = source_batches(args.data, transform, args.samples_per_font, args.batch_size,
+                                          args.workers, args.seed)
+    vectors, counts = prototypes(extractor, batches, len(classes), device)
+    keep = counts > 0
+    for cls, n in zip(classes, counts):
+        print(f"{cls:30s} {n:5d} samples" if n else f"{cls:30s} no samples, skipped")
+    return [c for c, k in zip(classes, keep) if k], vectors[keep]
+
+
+def bench(index: FontIndex, batch_sizes: List[int], k: int, iters: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for bs in batch_sizes:
+        queries = rng.standard_normal((bs, index.dim)).astype(np.float32)
+        index.search(queries, k)  # warmup, builds the float32 cache
+        times = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            index.search(queries, k)
+            times.append(time.perf_counter() - t0)
+        lat = statistics.median(times)
+        print(f"{len(index.fonts):8d} {index.dtype:>8s} {bs:5d} {lat * 1000:9.3f} {lat * 1e6 / bs:12.1f}")
+
+
+def synthetic_index(root: Path, fonts: int, dim: int, dtype: str, seed: int = 0) -> FontIndex:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((fonts, dim)).astype(np.float32)
+    index = FontIndex.create(root, dim, dtype)
+    index.add([f"font_{i}" for i in range(fonts)], vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and search a per-font embedding index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_source_args(p):
+        p.add_argument("--ckpt", type=Path, required=True)
+        p.add_argument("--index", type=Path, required=True, help="Index directory")
+        p.add_argument("--data", type=Path, help="ImageFolder or shard directory with a class per font")
+        p.add_argument("--render-fonts", nargs="+",
+                       help="Render fresh samples of these fonts instead of reading --data ('all' for every font)")
+        p.add_argument("--font-dir", type=str, default=None,
+                       help="Local TTF/OTF directory for --render-fonts (default: Google Fonts in a browser)")
+        p.add_argument("--phrases", type=str, default="phrases_10000.csv", help="Phrase file for --render-fonts")
+        p.add_argument("--samples-per-font", type=int, default=32, help="Samples averaged into each prototype")
+        p.add_argument("--batch-size", type=int, default=64)
+        p.add_argument("--workers", type=int, default=2, help="DataLoader workers for --data")
+        p.add_argument("--channels", type=int, choices=[1, 3], default=None)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--device", type=str, choices=["auto", "cpu", "cuda", "mps"], default="auto")
+
+    b = sub.add_parser("build", help="Create an index with one prototype per font")
+    add_source_args(b)
+    b.add_argument("--dtype", choices=DTYPES, default="float16", help="Storage type of the prototypes")
+    b.add_argument("--img-size", type=int, default=224)
+
+    a = sub.add_parser("add", help="Append prototypes for new fonts to an existing index")
+    add_source_args(a)
+
+    s = sub.add_parser("bench", help="Top-k lookup latency for an index, or for synthetic ones of given sizes")
+    s.add_argument("--index", type=Path, help="Index directory (default: synthetic indexes)")
+    s.add_argument("--fonts", type=str, default="13,1000,10000", help="Synthetic index sizes")
+    s.add_argument("--dim", type=int, default=512)
+    s.add_argument("--dtype", choices=DTYPES, nargs="+", default=list(DTYPES))
+    s.add_argument("--batch-sizes", type=str, default="1,64")
+    s.add_argument("--topk", type=int, default=5)
+    s.add_argument("--iters", type=int, default=100)
+    s.add_argument("--no-cache", action="store_true", help="Dequantize from the memmap on every search")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        batch_sizes = [int(x) for x in args.batch_sizes.split(",")]
+        print(f"{'fonts':>8s} {'dtype':>8s} {'batch':>5s} {'lat ms':>9s} {'us/query':>12s}")
+        if args.index:
+            bench(FontIndex(args.index, cache=not args.no_cache), batch_sizes, args.topk, args.iters)
+            return
+        for n in [int(x) for x in args.fonts.split(",")]:
+            for dtype in args.dtype:
+                with tempfile.TemporaryDirectory() as tmp:
+                    index = synthetic_index(Path(tmp), n, args.dim, dtype)
+                    index.cache = not args.no_cache
+                    bench(index, batch_sizes, args.topk, args.iters)
+        return
+
+    if not args.data and not args.render_fonts:
+        raise SystemExit("Give --data or --render-fonts")
+    device = get_device() if args.device == "auto" else torch.device(args.device)
+    extractor = load_extractor(args.ckpt, device, args.channels)
+
+    if args.command == "build":
+        index = FontIndex.create(args.index, extractor.dim, args.dtype,
+                                 checkpoint_digest(args.ckpt), args.img_size)
+    else:
+        index = FontIndex(args.index)
+        check_checkpoint(index, args.ckpt)
+    classes, vectors = embed_fonts(args, extractor, device, index.meta["img_size"])
+    index.add(classes, vectors)
+    print(f"{args.index}: {len(index.fonts)} fonts, {len(index)} prototypes ({index.dtype})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from inference import input_channels, iter_dir, load_model, make_transforms
+
+ENGINES = ("eager", "torchscript", "onnx", "int8")
+
+
+class Engine:
+    """Callable mapping a make_transforms batch (B,C,H,W) to logits, whatever runs underneath."""
+
+    def __init__(self, fn: Callable[[torch.Tensor], torch.Tensor], in_channels: int = 3,
+                 channels_last: bool = False):
+        self.fn = fn
+        self.in_channels = in_channels
+        self.channels_last = channels_last
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return self.fn(batch)
+
+
+class OnnxRunner:
+    def __init__(self, path: Path, threads: int = 0):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        (logits,) = self.session.run(None, {self.input_name: batch.cpu().numpy()})
+        return torch.from_numpy(logits)
+
+
+def sidecar_path(artifact: Path) -> Path:
+    return Path(str(artifact) + ".json")
+
+
+def load_images(paths: List[Path], img_size: int, in_channels: int = 3) -> torch.Tensor:
+    tfms = make_transforms(img_size, in_channels)
+    return torch.stack([tfms(Image.open(p).convert("RGB")) for p in paths])
+
+
+def calibration_batches(calib_dir: Path, img_size: int, samples: int, in_channels: int = 3,
+                        batch_size: int = 32):
+    paths = list(iter_dir(calib_dir))
+    if not paths:
+        raise SystemExit(f"No calibration images under {calib_dir}")
+    # Spread the calibration set across all classes rather than the first folder
+    step = max(1, len(paths) // samples)
+    paths = paths[::step][:samples]
+    for i in range(0, len(paths), batch_size):
+        yield load_images(paths[i:i + batch_size], img_size, in_channels)
+
+
+def quantize_static(model: nn.Module, example: torch.Tensor, calib_dir: Path, img_size: int,
+                    samples: int) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = "x86"
+    prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), example_inputs=(example,))
+    with torch.no_grad():
+        for batch in calibration_batches(calib_dir, img_size, samples, example.size(1)):
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    # Only the Linear head has a dynamic int8 kernel; convolutions stay float32
+    from torch.ao.quantization import quantize_dynamic as _quantize_dynamic
+
+    return _quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def export(ckpt: Path, engine: str, out: Path, img_size: int = 224, channels_last: bool = False,
+           quant: str = "static", calib_dir: Path = None, calib_samples: int = 256) -> Path:
+    device = torch.device("cpu")
+    model, classes = load_model(ckpt, device)
+    in_channels = input_channels(model)
+    example = torch.randn(1, in_channels, img_size, img_size)
+
+    if engine == "int8":
+        channels_last = False
+        if quant == "static":
+            if calib_dir is None:
+                raise SystemExit("Static int8 quantization needs --calib-dir with sample renders")
+            model = quantize_static(model, example, calib_dir, img_size, calib_samples)
+        else:
+            model = quantize_dynamic(model)
+    elif channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        if engine in ("torchscript", "int8"):
+            traced = torch.jit.freeze(torch.jit.trace(model, example).eval())
+            traced.save(str(out))
+        elif engine == "onnx":
+            torch.onnx.export(model, (example,), str(out), input_names=["input"], output_names=["logits"],
+                              dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}}, dynamo=False)
+        else:
+            raise ValueError(f"Nothing to export for engine '{engine}'")
+
+    with open(sidecar_path(out), "w") as f:
+        json.dump({"engine": engine, "classes": classes, "img_size": img_size, "in_channels": in_channels,
+                   "channels_last": channels_last, "quant": quant if engine == "int8" else None}, f)
+    return out
+
+
+def load_engine(engine: str, path: Path, device: torch.device, threads: int = 0) -> Tuple[Engine, List[str]]:
+    """Load a checkpoint (eager) or an exported artifact; returns (engine, classes)."""
+    if engine == "eager":
+        model, classes = load_model(path, device)
+        return Engine(model, input_channels(model)), classes
+
+    with open(sidecar_path(path)) as f:
+        meta = json.load(f)
+    if meta["engine"] != engine:
+        raise ValueError(f"{path} was exported for engine '{meta['engine']}', not '{engine}'")
+
+    if engine == "onnx":
+        return Engine(OnnxRunner(path, threads), meta.get("in_channels", 3)), meta["classes"]
+    if engine == "int8":
+        torch.backends.quantized.engine = "x86"
+        device = torch.device("cpu")  # quantized kernels are CPU-only
+    module = torch.jit.load(str(path), map_location=device)
+    if engine == "torchscript" and device.type == "cpu":
+        # Fuses conv/bn/relu for oneDNN; the result can't be saved, so it is applied at load time
+        module = torch.jit.optimize_for_inference(module)
+    return Engine(module, meta.get("in_channels", 3), meta.get("channels_last", False)), meta["classes"]
+
+
+def bench(ckpt: Path, artifacts: List[Tuple[str, Path]], images: Path, img_size: int,
+          batch_sizes: List[int], iters: int, threads: int):
+    if threads:
+        torch.set_num_threads(threads)
+    device = torch.device("cpu")
+    paths = list(iter_dir(images))
+    if not paths:
+        raise SystemExit(f"No images under {images}")
+    inputs = {}
+
+    reference, _ = load_engine("eager", ckpt, device)
+    engines = [("eager", reference)] + [(f"{name}:{path.name}", load_engine(name, path, device, threads)[0])
+                                        for name, path in artifacts]
+
+    with torch.no_grad():
+        data = inputs.setdefault(reference.in_channels, load_images(paths, img_size, reference.in_channels))
+        ref_top1 = torch.cat([reference(data[i:i + 64]).argmax(1) for i in range(0, len(data), 64)])
+        print(f"{'engine':28s} {'batch':>5s} {'lat ms':>9s} {'img/s':>9s} {'top1 agree':>10s}")
+        for name, run in engines:
+            if run.in_channels not in inputs:
+                inputs[run.in_channels] = load_images(paths, img_size, run.in_channels)
+            data = inputs[run.in_channels]
+            top1 = torch.cat([run(data[i:i + 64]).argmax(1) for i in range(0, len(data), 64)])
+            agree = (top1 == ref_top1).float().mean().item()
+            for bs in batch_sizes:
+                batch = data[:bs]
+                if batch.size(0) < bs:
+                    batch = batch.repeat((bs + batch.size(0) - 1) // batch.size(0), 1, 1, 1)[:bs]
+                run(batch)  # warmup
+                times = []
+                for _ in range(iters):
+                    t0 = time.perf_counter()
+                    run(batch)
+                    times.append(time.perf_counter() - t0)
+                lat = statistics.median(times)
+                print(f"{name:28s} {bs:5d} {lat * 1000:9.2f} {bs / lat:9.1f} {agree:10.4f}")
+
+
+def parse_artifact(value: str) -> Tuple[str, Path]:
+    engine, _, path = value.partition("=")
+    if engine not in ENGINES[1:] or not path:
+        raise argparse.ArgumentTypeError("expected ENGINE=PATH with ENGINE in torchscript|onnx|int8")
+    return engine, Path(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and benchmark optimized CPU inference engines")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Export best.ckpt.pt to TorchScript, ONNX or int8 TorchScript")
+    p.add_argument("--ckpt", type=Path, required=True)
+    p.add_argument("--engine", choices=ENGINES[1:], required=True)
+    p.add_argument("--out", type=Path, required=True)
+    p.add_argument("--img-size", type=int, default=224)
+    p.add_argument("--channels-last", action="store_true", help="Trace in channels_last (TorchScript)")
+    p.add_argument("--quant", choices=["static", "dynamic"], default="static",
+                   help="int8 mode: static (calibrated, convs too) or dynamic (Linear head only)")
+    p.add_argument("--calib-dir", type=Path, help="Sample renders for static calibration, e.g. data/")
+    p.add_argument("--calib-samples", type=int, default=256)
+
+    b = sub.add_parser("bench", help="Latency, throughput and top-1 agreement against the eager model")
+    b.add_argument("--ckpt", type=Path, required=True)
+    b.add_argument("--artifact", type=parse_artifact, action="append", default=[],
+                   help="ENGINE=PATH of an exported model (repeat for multiple)")
+    b.add_argument("--images", type=Path, required=True, help="Directory of evaluation images")
+    b.add_argument("--img-size", type=int, default=224)
+    b.add_argument("--batch-sizes", type=str, default="1,8,32")
+    b.add_argument("--iters", type=int, default=20)
+    b.add_argument("--threads", type=int, default=0, help="torch/onnxruntime intra-op threads (0 = default)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        out = export(args.ckpt, args.engine, args.out, args.img_size, args.channels_last,
+                     args.quant, args.calib_dir, args.calib_samples)
+        print(f"Wrote {out} and {sidecar_path(out)}")
+    else:
+        bench(args.ckpt, args.artifact, args.images, args.img_size,
+              [int(x) for x in args.batch_sizes.split(",")], args.iters, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import argparse
+import io
+import itertools
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import torch
 import torch.nn as nn
 from PIL import Image
 from torchvision import models, transforms
 
+from prediction_cache import checkpoint_digest
+
 
 def get_device() -> torch.device:
     if torch.backends.mps.is_available():
@@ -16,9 +25,62 @@ def get_device() -> torch.device:
     return torch.device("cpu")
 
 
-def build_model(num_classes: int) -> nn.Module:
-    model = models.resnet18(weights=None)
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+class GrayscaleStem(nn.Module):
+    """Single-channel replacement for a ResNet conv1 that expects ImageNet-normalized RGB.
+
+    Takes raw grayscale in [0, 1] and computes conv(x) - offset(ones). Folding a 3-channel conv
+    as conv = sum_c W_c / std_c and offset = sum_c W_c * mean_c / std_c gives the same output as
+    running the original conv on Grayscale(3) + Normalize, borders included, since zero padding
+    of the ones image matches zero padding of the normalized input.
+    """
+
+    def __init__(self, out_channels: int, kernel_size, stride, padding):
+        super().__init__()
+        self.conv = nn.Conv2d(1, out_channels, kernel_size, stride, padding, bias=False)
+        self.offset = nn.Conv2d(1, out_channels, kernel_size, stride, padding, bias=False)
+
+    @classmethod
+    def from_conv(cls, conv: nn.Conv2d, mean=IMAGENET_MEAN, std=IMAGENET_STD) -> "GrayscaleStem":
+        stem = cls(conv.out_channels, conv.kernel_size, conv.stride, conv.padding)
+        w = conv.weight.detach()
+        mean = w.new_tensor(mean).view(1, -1, 1, 1)
+        std = w.new_tensor(std).view(1, -1, 1, 1)
+        with torch.no_grad():
+            stem.conv.weight.copy_((w / std).sum(dim=1, keepdim=True))
+            stem.offset.weight.copy_((w * mean / std).sum(dim=1, keepdim=True))
+        return stem.to(w.device)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        # In place: the stem output is the largest activation and a separate subtraction pass costs
+        # as much as the FLOPs saved. Safe for autograd since conv backward doesn't need its output.
+        return self.conv(x).sub_(self.offset(torch.ones_like(x[:1])))
+
+
+def to_grayscale(model: nn.Module) -> nn.Module:
+    """Swap a 3-channel ResNet stem for an equivalent GrayscaleStem, in place."""
+    model.conv1 = GrayscaleStem.from_conv(model.conv1)
+    return model
+
+
+def input_channels(model) -> int:
+    if isinstance(getattr(model, "conv1", None), GrayscaleStem):
+        return 1
+    return getattr(model, "in_channels", 3)
+
+
+def state_channels(state: dict) -> int:
+    return 1 if "conv1.offset.weight" in state else 3
+
+
+def build_model(num_classes: int, in_channels: int = 3, pretrained: bool = False) -> nn.Module:
+    model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
     model.fc = nn.Linear(model.fc.in_features, num_classes)
+    if in_channels == 1:
+        to_grayscale(model)
     return model
 
 
@@ -29,16 +91,27 @@ def load_checkpoint(ckpt_path: Path, device: torch.device):
     return ckpt["model_state"], ckpt["classes"]
 
 
-def make_transforms(img_size: int) -> transforms.Compose:
+def make_transforms(img_size: int, in_channels: int = 3) -> transforms.Compose:
+    if in_channels == 1:
+        # Normalization is folded into GrayscaleStem
+        return transforms.Compose([
+            transforms.Grayscale(1),
+            transforms.Resize(int(img_size * 1.15), antialias=True),
+            transforms.CenterCrop(img_size),
+            transforms.ToTensor(),
+        ])
     return transforms.Compose([
         transforms.Grayscale(3),
         transforms.Resize(int(img_size * 1.15), antialias=True),
         transforms.CenterCrop(img_size),
         transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD),
     ])
 
 
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".ppm", ".bmp", ".pgm", ".tif", ".tiff", ".webp")
+
+
 def load_images(paths: List[Path]) -> List[Image.Image]:
     images = []
     for p in paths:
@@ -47,14 +120,192 @@ def load_images(paths: List[Path]) -> List[Image.Image]:
     return images
 
 
+def load_model(ckpt_path: Path, device: torch.device, in_channels: Optional[int] = None):
+    """Load a 3- or 1-channel checkpoint; in_channels=1 folds a 3-channel one into GrayscaleStem."""
+    state, classes = load_checkpoint(ckpt_path, device)
+    saved_channels = state_channels(state)
+    model = build_model(num_classes=len(classes), in_channels=saved_channels).to(device)
+    model.load_state_dict(state)
+    if in_channels == 1 and saved_channels == 3:
+        to_grayscale(model)
+    elif in_channels == 3 and saved_channels == 1:
+        raise ValueError(f"{ckpt_path} is a 1-channel checkpoint and can't be expanded to 3 channels")
+    model.eval()
+    return model, classes
+
+
+def convert_checkpoint(src: Path, dst: Path):
+    """Write a 1-channel copy of a 3-channel checkpoint."""
+    model, classes = load_model(src, torch.device("cpu"), in_channels=1)
+    torch.save({"model_state": model.state_dict(), "classes": classes, "in_channels": 1}, dst)
+
+
+def iter_dir(root: Path) -> Iterator[Path]:
+    # Sorting dirnames in place makes os.walk descend in order without listing the whole tree first
+    for dirpath, dirnames, fnames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(fnames):
+            if fname.lower().endswith(IMG_EXTENSIONS):
+                yield Path(dirpath) / fname
+
+
+def iter_lines(lines: Iterable[str]) -> Iterator[Path]:
+    """Paths from a text manifest (one per line) or JSONL manifest ({"path": ...} per line)."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        yield Path(json.loads(line)["path"] if line.startswith("{") else line)
+
+
+def iter_manifest(path: Path) -> Iterator[Path]:
+    with open(path) as f:
+        yield from iter_lines(f)
+
+
+def iter_batches(paths: Iterable[Path], tfms, batch_size: int, workers: int, prefetch: int = 2,
+                 collate=torch.stack, lookup: Optional[Callable[[bytes], Tuple[str, Any]]] = None
+                 ) -> Iterator[Tuple[List[Path], Optional[torch.Tensor], Dict[int, str], Dict[int, Tuple[str, Any]]]]:
+    """Decode and transform images on a thread pool, yielding (paths, batch, errors, lookups) in
+    input order.
+
+    batch collates the images that loaded; errors maps positions in paths that failed to a message.
+    With lookup (encoded bytes -> (key, cached result or None)), lookups maps each position to
+    what it returned, and images with a cached result are neither decoded nor part of batch.
+
+    At most (prefetch + 1) batches are in flight, so memory stays bounded for any number of paths.
+    """
+    def load(p: Path):
+        if lookup is None:
+            with Image.open(p) as img:
+                return None, tfms(img.convert("RGB"))
+        data = p.read_bytes()
+        key, cached = lookup(data)
+        if cached is not None:
+            return (key, cached), None
+        with Image.open(io.BytesIO(data)) as img:
+            return (key, None), tfms(img.convert("RGB"))
+
+    window = batch_size * (prefetch + 1)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        path_iter = iter(paths)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < window:
+                p = next(path_iter, None)
+                if p is None:
+                    exhausted = True
+                else:
+                    pending.append((p, pool.submit(load, p)))
+
+            batch_paths, tensors, errors, lookups = [], [], {}, {}
+            while pending and len(batch_paths) < batch_size:
+                p, future = pending.popleft()
+                try:
+                    looked_up, tensor = future.result()
+                except Exception as e:
+                    errors[len(batch_paths)] = f"{type(e).__name__}: {e}"
+                else:
+                    if looked_up is not None:
+                        lookups[len(batch_paths)] = looked_up
+                    if tensor is not None:
+                        tensors.append(tensor)
+                batch_paths.append(p)
+            batch = collate(tensors) if tensors else None
+            yield batch_paths, batch, errors, lookups
+
+
+def predict_probs(model: nn.Module, batch: torch.Tensor, device: torch.device) -> torch.Tensor:
+    """Softmax probabilities on the CPU for a single batch; waits for the result. See
+    DevicePipeline for overlapping a stream of batches."""
+    if device.type == "cuda":
+        batch = batch.pin_memory()
+    batch = batch.to(device, non_blocking=True)
+    with torch.no_grad():
+        logits = model(batch)
+        return torch.softmax(logits, dim=1).cpu()
+
+
+def predict(model: nn.Module, batch: torch.Tensor, device: torch.device, topk: int):
+    return predict_probs(model, batch, device).topk(k=topk, dim=1)
+
+
+class DevicePipeline:
+    """Runs fn (device batch -> device tensor) over a stream of CPU batches, one batch ahead.
+
+    On CUDA, submit() pins the batch, copies it on a side stream, queues fn behind the copy and a
+    non-blocking copy of the output into pinned memory, and returns without waiting. Submitting
+    batch N+1 before calling batch N's result() overlaps N+1's host-to-device copy with N's
+    compute. Elsewhere submit() computes the batch right away.
+    """
+
+    def __init__(self, fn: Callable[[torch.Tensor], torch.Tensor], device: torch.device):
+        self.fn = fn
+        self.device = device
+        self.stream = torch.cuda.Stream(device) if device.type == "cuda" else None
+
+    def submit(self, batch: torch.Tensor) -> Callable[[], torch.Tensor]:
+        """Queue batch; the returned function waits for and returns its output on the CPU."""
+        if self.stream is None:
+            with torch.no_grad():
+                out = self.fn(batch.to(self.device)).cpu()
+            return lambda: out
+
+        batch = batch.pin_memory()
+        with torch.cuda.stream(self.stream):
+            on_device = batch.to(self.device, non_blocking=True)
+        compute = torch.cuda.current_stream(self.device)
+        compute.wait_stream(self.stream)
+        # Allocated on the side stream; keep the memory from being reused before compute is done
+        on_device.record_stream(compute)
+        with torch.no_grad():
+            out = self.fn(on_device)
+        host = torch.empty(out.shape, dtype=out.dtype, pin_memory=True)
+        host.copy_(out, non_blocking=True)
+        done = torch.cuda.Event()
+        done.record(compute)
+
+        def result() -> torch.Tensor:
+            done.synchronize()
+            return host
+
+        return result
+
+
 def main():
     parser = argparse.ArgumentParser(description="Font classifier inference")
-    parser.add_argument("--ckpt", type=Path, required=True, help="Path to best.ckpt.pt")
-    parser.add_argument("--image", type=Path, action="append", required=True,
+    parser.add_argument("--ckpt", type=Path, required=True,
+                        help="Path to best.ckpt.pt, or to an artifact from export.py for other engines")
+    parser.add_argument("--engine", type=str, choices=["eager", "torchscript", "onnx", "int8"], default="eager",
+                        help="Eager PyTorch checkpoint or an exported engine (see export.py)")
+    parser.add_argument("--image", type=Path, action="append", default=[],
                         help="Image path (repeat for multiple)")
+    parser.add_argument("--input-dir", type=Path, help="Classify every image under this directory")
+    parser.add_argument("--manifest", type=Path, help="Text file of paths, or JSONL with a 'path' field")
+    parser.add_argument("--stdin", action="store_true", help="Read image paths from stdin, one per line")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Write JSONL results here ('-' for stdout) instead of the text report")
+    parser.add_argument("--regions", action="store_true",
+                        help="Detect text blocks in large images and vote over their crops")
+    parser.add_argument("--max-regions", type=int, default=16, help="Text blocks used per image with --regions")
+    parser.add_argument("--index", type=Path, default=None,
+                        help="Rank fonts by nearest prototype in this embedding index (see embeddings.py) "
+                             "instead of the classifier head")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4, help="Decode/transform threads")
+    parser.add_argument("--channels", type=int, choices=[1, 3], default=None,
+                        help="Model input channels; 1 folds a 3-channel checkpoint (default: as saved)")
+    parser.add_argument("--save-gray", type=Path, default=None,
+                        help="Convert --ckpt to a 1-channel checkpoint at this path and exit")
     parser.add_argument("--topk", type=int, default=5, help="Show top-K predictions")
     parser.add_argument("--img-size", type=int, default=224, help="Model input size")
     parser.add_argument("--device", type=str, choices=["auto", "cpu", "cuda", "mps"], default="auto")
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse predictions for byte-identical images (in memory, for this run)")
+    parser.add_argument("--cache-db", type=Path, default=None,
+                        help="Also keep cached predictions in this SQLite file across runs (implies --cache)")
+    parser.add_argument("--cache-mb", type=int, default=64, help="In-memory cache size")
     args = parser.parse_args()
 
     # Resolve device
@@ -62,35 +313,146 @@ def main():
         device = get_device()
     else:
         device = torch.device(args.device)
+    if args.engine in ("onnx", "int8"):
+        device = torch.device("cpu")
 
-    # Load checkpoint/classes
-    state, classes = load_checkpoint(args.ckpt, device)
-    model = build_model(num_classes=len(classes)).to(device)
-    model.load_state_dict(state)
-    model.eval()
+    if args.save_gray:
+        convert_checkpoint(args.ckpt, args.save_gray)
+        print(f"Wrote 1-channel checkpoint {args.save_gray}")
+        return
 
-    # Preprocess
-    tfms = make_transforms(args.img_size)
+    # Collect input sources; everything but --image is streamed
     img_paths = [p for p in args.image if p.exists()]
-    if not img_paths:
+    sources = [img_paths]
+    if args.input_dir:
+        sources.append(iter_dir(args.input_dir))
+    if args.manifest:
+        sources.append(iter_manifest(args.manifest))
+    if args.stdin:
+        sources.append(iter_lines(sys.stdin))
+    if len(sources) == 1 and not img_paths:
         raise SystemExit("No valid image paths provided.")
 
-    batch = torch.stack([tfms(Image.open(p).convert("RGB")) for p in img_paths]).to(device)
+    # Load checkpoint/classes
+    index = None
+    if args.index:
+        if args.engine != "eager":
+            raise SystemExit("--index needs the eager checkpoint (--engine eager)")
+        from embeddings import FontIndex, check_checkpoint, load_extractor
+        index = FontIndex(args.index)
+        check_checkpoint(index, args.ckpt)
+        model = load_extractor(args.ckpt, device, in_channels=args.channels)
+        classes = index.fonts
+        args.img_size = index.meta["img_size"]
+    elif args.engine == "eager":
+        model, classes = load_model(args.ckpt, device, in_channels=args.channels)
+    else:
+        from export import load_engine
+        model, classes = load_engine(args.engine, args.ckpt, device)
+    topk = min(args.topk, len(classes))
+    # Classifier probabilities, or embeddings compared to font prototypes with --index
+    if index is None:
+        def score(batch: torch.Tensor) -> torch.Tensor:
+            return torch.softmax(model(batch), dim=1)
+    else:
+        def score(batch: torch.Tensor) -> torch.Tensor:
+            return model(batch).float()
+    pipeline = DevicePipeline(score, device)
+    score_key = "prob" if index is None else "score"
+    tfms = make_transforms(args.img_size, input_channels(model))
+    collate = torch.stack
+    if args.regions:
+        from text_regions import RegionCrops, collate_regions, page_vote
+        tfms = RegionCrops(tfms, max_regions=args.max_regions)
+        collate = collate_regions
 
-    with torch.no_grad():
-        logits = model(batch)
-        probs = torch.softmax(logits, dim=1)
-        confs, idxs = probs.topk(k=min(args.topk, len(classes)), dim=1)
-
-    # Print results
-    for i, p in enumerate(img_paths):
-        print(f"\n{p}:")
-        for k in range(confs.size(1)):
-            cls = classes[idxs[i, k].item()]
-            conf = float(confs[i, k].item())
-            prefix = "*" if k == 0 else " "
-            print(f"{prefix} {cls:20s}  {conf:.4f}")
+    cache, lookup = None, None
+    if args.cache or args.cache_db:
+        from prediction_cache import PredictionCache, cache_namespace, image_key
+        cache = PredictionCache(cache_namespace(args.ckpt, args.img_size), args.cache_mb << 20, args.cache_db)
+        # Everything besides the checkpoint and img_size that changes a record
+        variant = f"{args.engine}:c{input_channels(model)}:top{topk}"
+        if args.regions:
+            variant += f":regions{args.max_regions}"
+        if index is not None:
+            from embeddings import META_FILE
+            variant += f":index{checkpoint_digest(args.index / META_FILE)}"
+
+        def lookup(data: bytes):
+            key = image_key(data, variant)
+            return key, cache.get(key)
+
+    out = None
+    if args.output == "-":
+        out = sys.stdout
+    elif args.output:
+        out = open(args.output, "w")
+
+    def write(paths, errors, lookups, result, regions):
+        """Turn a batch's scores into records, write them out and cache them."""
+        if result is not None:
+            probs = result()
+            if regions is not None:
+                sizes, weights = regions
+                probs = page_vote(probs, sizes, weights)
+            if index is not None:
+                confs, idxs = map(torch.from_numpy, index.search(probs.numpy(), topk))
+            else:
+                confs, idxs = probs.topk(k=topk, dim=1)
+
+        i = 0
+        computed = []
+        for j, p in enumerate(paths):
+            if j in errors:
+                if out:
+                    out.write(json.dumps({"path": str(p), "error": errors[j]}) + "\n")
+                else:
+                    print(f"\n{p}: error: {errors[j]}")
+                continue
+            key, record = lookups.get(j, (None, None))
+            if record is None:
+                preds = [{"class": classes[idxs[i, k].item()], score_key: float(confs[i, k].item())}
+                         for k in range(confs.size(1))]
+                record = {"topk": preds}
+                if regions is not None:
+                    record["regions"] = sizes[i]
+                if key is not None:
+                    computed.append((key, record))
+                i += 1
+            if out:
+                out.write(json.dumps({"path": str(p), **record}) + "\n")
+            else:
+                print(f"\n{p}:")
+                for k, pred in enumerate(record["topk"]):
+                    prefix = "*" if k == 0 else " "
+                    print(f"{prefix} {pred['class']:20s}  {pred[score_key]:.4f}")
+        if cache is not None:
+            cache.put_many(computed)
+        if out:
+            out.flush()
 
+    try:
+        pending = None
+        for paths, batch, errors, lookups in iter_batches(itertools.chain(*sources), tfms, args.batch_size,
+                                                          args.workers, collate=collate, lookup=lookup):
+            result, regions = None, None
+            if batch is not None:
+                if args.regions:
+                    # Every crop of every image in the batch goes through one forward pass
+                    batch, *regions = batch
+                result = pipeline.submit(batch)
+            # This batch is queued on the device before waiting for the previous one's results
+            if pending is not None:
+                write(*pending)
+            pending = (paths, errors, lookups, result, regions)
+        if pending is not None:
+            write(*pending)
+    finally:
+        if out and out is not sys.stdout:
+            out.close()
+        if cache is not None:
+            print(f"prediction cache: {json.dumps(cache.metrics())}", file=sys.stderr)
+            cache.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,121 @@
+import argparse
+import http.client
+import json
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from inference import iter_dir
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def connect(args) -> http.client.HTTPConnection:
+    if args.unix_socket:
+        return UnixHTTPConnection(str(args.unix_socket))
+    return http.client.HTTPConnection(args.host, args.port)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay images against serve.py and report latency/throughput")
+    parser.add_argument("--images", type=Path, action="append", required=True,
+                        help="Image file or directory (repeat for multiple)")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", type=Path, default=None)
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel client connections")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests to send")
+    parser.add_argument("--topk", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = []
+    for p in args.images:
+        paths.extend(iter_dir(p) if p.is_dir() else [p])
+    if not paths:
+        raise SystemExit("No images found.")
+    payloads = [p.read_bytes() for p in paths]
+
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        nonlocal errors
+        conn = connect(args)
+        for i in counter:
+            body = payloads[i % len(payloads)]
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", f"/predict?topk={args.topk}", body=body,
+                             headers={"Content-Type": "application/octet-stream"})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = connect(args)
+                ok = False
+            dt = time.perf_counter() - t0
+            with lock:
+                if ok:
+                    latencies.append(dt)
+                else:
+                    errors += 1
+        conn.close()
+
+    def server_metrics() -> dict:
+        conn = connect(args)
+        conn.request("GET", "/metrics")
+        metrics = json.loads(conn.getresponse().read())
+        conn.close()
+        return metrics
+
+    cache_before = server_metrics().get("cache")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    print(f"requests: {len(latencies)} ok, {errors} errors in {elapsed:.2f}s "
+          f"(concurrency={args.concurrency})")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms: p50 {percentile(ms, 0.50):.1f} | p90 {percentile(ms, 0.90):.1f} | "
+          f"p99 {percentile(ms, 0.99):.1f} | max {ms[-1] if ms else 0.0:.1f}")
+    metrics = server_metrics()
+    cache = metrics.get("cache")
+    if cache and cache_before:
+        # Hits are answered without the model, so a high rate means the latencies above mostly
+        # measure the cache; restart serve.py without --cache to measure batching and the model
+        lookups = cache["lookups"] - cache_before["lookups"]
+        hits = cache["hits"] + cache["disk_hits"] - cache_before["hits"] - cache_before["disk_hits"]
+        print(f"cache: {hits}/{lookups} hits ({hits / lookups if lookups else 0.0:.1%}), "
+              f"{lookups - hits} requests reached the model")
+    else:
+        print("cache: off")
+    print("server metrics:", json.dumps(metrics))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import heapq
+import random
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+from create_phrases import read_phrases, write_phrases
+
+MINHASH_PRIME = (1 << 32) - 5
+
+
+def shingles(text: str, n: int = 5) -> Set[int]:
+    """crc32 of the character n-grams of text (case-sensitive, since case changes the glyphs)."""
+    if len(text) <= n:
+        return {zlib.crc32(text.encode())}
+    data = text.encode()
+    return {zlib.crc32(data[i:i + n]) for i in range(len(data) - n + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, hashes: Set[int]) -> np.ndarray:
+        x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[None]
+        return ((self.a * x + self.b) % MINHASH_PRIME).min(axis=1)
+
+
+def dedup(phrases: Iterable[str], threshold: float = 0.7, num_perm: int = 64, bands: int = 16,
+          ngram: int = 5) -> List[str]:
+    """Drop exact duplicates and phrases whose estimated Jaccard similarity (MinHash over
+    character n-grams) with an already kept phrase is at least threshold. First occurrence wins.
+
+    Candidates come from LSH buckets (bands x num_perm/bands rows) and are checked against the
+    full signature, so the threshold is applied exactly up to MinHash estimation error.
+    """
+    if num_perm % bands:
+        raise ValueError("num_perm must be a multiple of bands")
+    rows = num_perm // bands
+    hasher = MinHasher(num_perm)
+    seen = set()
+    buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+    signatures: List[np.ndarray] = []
+    kept = []
+    for phrase in phrases:
+        if phrase in seen:
+            continue
+        seen.add(phrase)
+        sig = hasher.signature(shingles(phrase, ngram))
+        keys = [sig[i * rows:(i + 1) * rows].tobytes() for i in range(bands)]
+        candidates = {j for band, key in zip(buckets, keys) for j in band.get(key, ())}
+        if any((signatures[j] == sig).mean() >= threshold for j in candidates):
+            continue
+        for band, key in zip(buckets, keys):
+            band.setdefault(key, []).append(len(kept))
+        signatures.append(sig)
+        kept.append(phrase)
+    return kept
+
+
+def features(text: str) -> Set[str]:
+    """Characters and character bigrams a rendered phrase shows."""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+SENTENCE_BREAK = re.compile(r'[.?!]["\u201d]?\s+\S')
+
+
+def length_bucket(text: str) -> int:
+    """0: single word, 1: sentence, 2: paragraph (more than one sentence)."""
+    if " " not in text:
+        return 0
+    return 2 if SENTENCE_BREAK.search(text) else 1
+
+
+def bucket_mix(phrases: Iterable[str]) -> Dict[int, float]:
+    """Share of words, sentences and paragraphs in phrases."""
+    counts = Counter(length_bucket(p) for p in phrases)
+    total = sum(counts.values())
+    return {b: n / total for b, n in counts.items()}
+
+
+def select_phrases(phrases: Sequence[str], budget: int, bigram_weight: float = 0.5,
+                   seed: int = 0, mix: Optional[Dict[int, float]] = None) -> List[str]:
+    """Greedily pick up to budget phrases maximizing weighted coverage of characters (weight 1)
+    and bigrams (bigram_weight).
+
+    Picks rotate over words, sentences and paragraphs in the proportions of mix (default: the
+    pool's own), so coverage doesn't turn the dataset into paragraphs only. Once nothing new can be covered the covered
+    set is reset and coverage starts over. The result is prefix-stable: a smaller budget gives a
+    prefix of a larger one.
+    """
+    order = list(range(len(phrases)))
+    random.Random(seed).shuffle(order)  # tie-break between equal gains
+    feats = [features(p) for p in phrases]
+
+    def weight(f: str) -> float:
+        return 1.0 if len(f) == 1 else bigram_weight
+
+    shares = bucket_mix(phrases) if mix is None else mix
+    picked_per_bucket = Counter()
+    selected, used = [], [False] * len(phrases)
+    covered: Set[str] = set()
+
+    def build_heaps():
+        heaps = {b: [] for b in range(3)}
+        for rank, i in enumerate(order):
+            if not used[i]:
+                gain = sum(weight(f) for f in feats[i] - covered)
+                heaps[length_bucket(phrases[i])].append((-gain, rank, i))
+        for h in heaps.values():
+            heapq.heapify(h)
+        return heaps
+
+    heaps = build_heaps()
+    while len(selected) < min(budget, len(phrases)):
+        # Bucket furthest below its share of the picks so far
+        bucket = min((b for b in heaps if heaps[b] and shares.get(b)),
+                     key=lambda b: (picked_per_bucket[b] + 1) / shares[b])
+        h = heaps[bucket]
+        # Lazy greedy: stored gains are upper bounds, so re-score the top until it stays on top
+        while True:
+            _, rank, i = heapq.heappop(h)
+            gain = sum(weight(f) for f in feats[i] - covered)
+            if not h or -gain <= h[0][0]:
+                break
+            heapq.heappush(h, (-gain, rank, i))
+        if gain == 0 and covered:
+            covered = set()
+            heaps = build_heaps()
+            continue
+        used[i] = True
+        selected.append(phrases[i])
+        covered |= feats[i]
+        picked_per_bucket[bucket] += 1
+    return selected
+
+
+def coverage(phrases: Iterable[str]) -> Dict[str, int]:
+    """Distinct characters, bigrams, digits, punctuation and capitals shown by phrases."""
+    chars, bigrams = set(), set()
+    for p in phrases:
+        chars.update(p)
+        bigrams.update(p[i:i + 2] for i in range(len(p) - 1))
+    return {
+        "chars": len(chars),
+        "bigrams": len(bigrams),
+        "digits": sum(c.isdigit() for c in chars),
+        "punctuation": sum(not c.isalnum() and not c.isspace() for c in chars),
+        "capitals": sum(c.isupper() for c in chars),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate a phrase file and pick a coverage-maximizing subset")
+    parser.add_argument("input", type=Path, help="Phrase file (.csv or .parquet)")
+    parser.add_argument("output", type=Path, help="Selected phrases (.csv or .parquet)")
+    parser.add_argument("--budget", type=int, default=500, help="Phrases to keep (samples per font)")
+    parser.add_argument("--threshold", type=float, default=0.7, help="MinHash Jaccard for near duplicates")
+    parser.add_argument("--bigram-weight", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    phrases = list(read_phrases(args.input))
+    unique = dedup(phrases, threshold=args.threshold)
+    print(f"{len(phrases)} phrases, {len(unique)} after removing exact and near duplicates")
+    selected = select_phrases(unique, args.budget, args.bigram_weight, args.seed, mix=bucket_mix(phrases))
+    baseline = random.Random(args.seed).sample(phrases, min(args.budget, len(phrases)))
+    print(f"coverage of {len(selected)} selected: {coverage(selected)}")
+    print(f"coverage of {len(baseline)} random:   {coverage(baseline)}")
+    print(f"coverage of all {len(phrases)}:       {coverage(phrases)}")
+    kinds = ["word", "sentence", "paragraph"]
+    write_phrases(((kinds[length_bucket(p)], p) for p in selected), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Iterable, Optional, Tuple
+
+
+def checkpoint_digest(ckpt_path: Path) -> str:
+    """sha1 of the checkpoint file, for tagging artifacts derived from its weights."""
+    h = hashlib.sha1()
+    with open(ckpt_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def image_key(data: bytes, variant: str = "") -> str:
+    """Content hash of the encoded image, plus whatever else changes the answer (topk, mode)."""
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return f"{digest}:{variant}" if variant else digest
+
+
+def cache_namespace(ckpt: Path, img_size: int) -> str:
+    return f"{checkpoint_digest(ckpt)}:{img_size}"
+
+
+class PredictionCache:
+    """Content-addressed cache of prediction records, keyed by image_key() within a namespace
+    (checkpoint digest + img_size, see cache_namespace).
+
+    An in-memory LRU holds at most max_bytes of JSON-encoded values. With path set, a SQLite
+    file backs it and survives restarts; rows from other namespaces, i.e. from an older
+    checkpoint, are deleted when it is opened. Hits never touch the model, and every get()
+    returns a fresh copy. Thread-safe.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = 64 << 20, path: Optional[Path] = None):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.memory: "OrderedDict[str, str]" = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(str(path), check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS predictions "
+                            "(namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))")
+            self.db.execute("DELETE FROM predictions WHERE namespace != ?", (namespace,))
+            self.db.commit()
+
+    def _remember(self, key: str, value: str):
+        if key in self.memory:
+            self.bytes -= len(self.memory.pop(key))
+        if len(value) > self.max_bytes:
+            return
+        self.memory[key] = value
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            _, old = self.memory.popitem(last=False)
+            self.bytes -= len(old)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        with self.lock:
+            value = self.memory.get(key)
+            if value is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(value)
+            if self.db is not None:
+                row = self.db.execute("SELECT value FROM predictions WHERE namespace = ? AND key = ?",
+                                      (self.namespace, key)).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put_many(self, items: Iterable[Tuple[str, Any]]):
+        """Store (key, value) pairs; one disk transaction for all of them."""
+        encoded = [(key, json.dumps(value)) for key, value in items]
+        with self.lock:
+            for key, value in encoded:
+                self._remember(key, value)
+            if self.db is not None and encoded:
+                self.db.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)",
+                                    [(self.namespace, key, value) for key, value in encoded])
+                self.db.commit()
+
+    def put(self, key: str, value: Any):
+        self.put_many([(key, value)])
+
+    def metrics(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "lookups": lookups,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self.memory),
+                "bytes": self.bytes,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
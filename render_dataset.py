@@ -0,0 +1,127 @@
+import io
+import os
+import random
+from multiprocessing import util
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import torch.distributed as dist
+from PIL import Image
+from torch.utils.data import IterableDataset, get_worker_info
+
+
+def shuffle_buffer(items: Iterator, size: int, rng: random.Random) -> Iterator:
+    """Yield items in random order using a buffer of at most size items."""
+    if size <= 1:
+        yield from items
+        return
+    buffer = []
+    for item in items:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class RenderedFontDataset(IterableDataset):
+    """samples_per_epoch fresh (transform(image), label) samples per epoch, rendered on the fly by
+    a FontDatasetGenerator (Playwright) or LocalFontDatasetGenerator (Pillow), with no disk I/O.
+
+    Each DataLoader worker starts its own renderer once and keeps it for the life of the
+    process, so with persistent_workers a browser page is reused across epochs. Every
+    (epoch, rank, worker) draws from its own RNG seeded from seed, so samples never repeat
+    across workers or epochs; call set_epoch() each epoch when workers are not persistent.
+    fixed=True replays the same samples every epoch, for validation.
+
+    Samples are rendered in groups of group_size sharing one font (one page capture with the
+    browser renderer) and decorrelated by a shuffle buffer. Classes are the folder names
+    render_phrases.py would write, so checkpoints match ones trained on data/.
+    """
+
+    def __init__(self, generator, fonts: Sequence[str], phrases: Sequence[str], samples_per_epoch: int,
+                 transform=None, seed: int = 0, shuffle_buffer: int = 1024, group_size: int = 16,
+                 fixed: bool = False):
+        self.generator = generator
+        self.fonts = sorted(fonts, key=lambda f: f.replace(' ', '_'))
+        self.classes = [f.replace(' ', '_') for f in self.fonts]
+        self.phrases = list(phrases)
+        self.samples_per_epoch = samples_per_epoch
+        self.transform = transform
+        self.seed = seed
+        self.shuffle_buffer = shuffle_buffer
+        self.group_size = group_size
+        self.fixed = fixed
+        self.epoch = 0
+        self._iterations = 0
+        self._pid = None
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    @staticmethod
+    def _rank() -> Tuple[int, int]:
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_rank(), dist.get_world_size()
+        return 0, 1
+
+    def __len__(self) -> int:
+        # Per rank, like a DistributedSampler
+        return self.samples_per_epoch // self._rank()[1]
+
+    def _start(self):
+        if self._pid != os.getpid():
+            self.generator.start_browser(self.fonts)
+            util.Finalize(None, self.generator.stop_browser, exitpriority=10)
+            self._pid = os.getpid()
+
+    def _render(self, rng: random.Random, count: int) -> Iterator:
+        direct = hasattr(self.generator, "render_layout_image")
+        while count > 0:
+            label = rng.randrange(len(self.fonts))
+            font = self.fonts[label]
+            items = []
+            for _ in range(min(self.group_size, count)):
+                text = rng.choice(self.phrases)
+                items.append((text, font, self.generator.sample_layout(text, rng)))
+            if direct:
+                images = [self.generator.render_layout_image(*item) for item in items]
+            else:
+                images = [Image.open(io.BytesIO(png)) for png in self.generator.render_batch(items)]
+            for img in images:
+                img = img.convert("RGB")
+                yield (self.transform(img) if self.transform is not None else img), label
+            count -= len(items)
+
+    def __iter__(self) -> Iterator:
+        rank, world = self._rank()
+        info = get_worker_info()
+        worker, num_workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        total = len(self)
+        count = total // num_workers + (worker < total % num_workers)
+
+        epoch = 0 if self.fixed else self.epoch + self._iterations
+        if not self.fixed:
+            # Persistent workers never see set_epoch(); their own iteration count moves them on
+            self._iterations += 1
+        self._start()
+        rng = random.Random(f"{self.seed}:{epoch}:{rank}:{worker}")
+        return shuffle_buffer(self._render(rng, count), self.shuffle_buffer, random.Random(rng.random()))
+
+
+def split_phrases(phrases: List[str], val_split: float, seed: int) -> Tuple[List[str], List[str]]:
+    """Seeded split so validation renders phrases the model never trained on."""
+    phrases = random.Random(seed).sample(phrases, len(phrases))
+    n_val = max(1, int(len(phrases) * val_split))
+    return phrases[n_val:], phrases[:n_val]
+
+
+def make_generator(font_dir: Optional[str] = None):
+    """Pillow renderer for a local font directory, otherwise the Playwright/Google Fonts one."""
+    from render_phrases import FontDatasetGenerator, LocalFontDatasetGenerator
+
+    if font_dir:
+        return LocalFontDatasetGenerator(font_dir)
+    return FontDatasetGenerator()
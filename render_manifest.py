@@ -0,0 +1,66 @@
+import json
+import os
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_FILE = "manifest.jsonl"
+
+
+class RenderManifest:
+    """Append-only JSONL log of finished samples, used to resume and extend a dataset.
+
+    A sample (font, text_idx) counts as done when its record has the same seed, phrase and
+    render params as the current run. Records are buffered by record() and only written by
+    commit(), which callers invoke after the sample data itself is on disk. Later records
+    override earlier ones, and a torn last line from an interrupted run is ignored.
+    """
+
+    def __init__(self, root: Path, seed: Optional[int] = None, params: Optional[Dict] = None):
+        self.path = Path(root) / MANIFEST_FILE
+        self.params = params or {}
+        self.records: Dict[Tuple[str, int], Dict] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.records[(r["font"], r["text_idx"])] = r
+        # Unseeded runs continue with the seed of the run they resume, or pick a fresh one,
+        # so that every sample can be re-rendered on its own later
+        self.seed = seed if seed is not None else self.previous_seed()
+        if self.seed is None:
+            self.seed = int.from_bytes(os.urandom(4), "little")
+        self.pending: List[Dict] = []
+
+    def previous_seed(self) -> Optional[int]:
+        seeds = Counter(r["seed"] for r in self.records.values())
+        return seeds.most_common(1)[0][0] if seeds else None
+
+    def is_done(self, font: str, text_idx: int, text: str) -> bool:
+        r = self.records.get((font, text_idx))
+        return (r is not None and r["seed"] == self.seed and r["text"] == text
+                and r["params"] == self.params)
+
+    def get(self, font: str, text_idx: int) -> Optional[Dict]:
+        return self.records.get((font, text_idx))
+
+    def record(self, font: str, text_idx: int, text: str, output: str):
+        self.pending.append({"font": font, "text_idx": text_idx, "seed": self.seed, "text": text,
+                             "params": self.params, "output": output})
+
+    def commit(self):
+        if not self.pending:
+            return
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(r) + "\n" for r in self.pending)
+            f.flush()
+            os.fsync(f.fileno())
+        for r in self.pending:
+            self.records[(r["font"], r["text_idx"])] = r
+        self.pending = []
+
+    def __len__(self) -> int:
+        return len(self.records)
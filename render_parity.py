@@ -0,0 +1,130 @@
+import argparse
+import base64
+import io
+import random
+import statistics
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from create_phrases import read_phrases
+from render_phrases import FontDatasetGenerator, LocalFontDatasetGenerator
+
+
+class LocalFilesBrowserGenerator(FontDatasetGenerator):
+    """Browser renderer using the font files of a LocalFontDatasetGenerator (as @font-face data
+    URLs) instead of Google Fonts, so both renderers draw the same glyphs."""
+
+    def __init__(self, font_files: Dict[str, Path]):
+        super().__init__()
+        self.font_files = font_files
+
+    def _setup_fonts(self, fonts):
+        super()._setup_fonts([])
+        faces = []
+        for font in fonts:
+            path = self.font_files[font]
+            data = base64.b64encode(path.read_bytes()).decode()
+            fmt = "opentype" if path.suffix.lower() == ".otf" else "truetype"
+            faces.append(f'@font-face {{ font-family: "{font}"; '
+                         f'src: url(data:font/{path.suffix[1:].lower()};base64,{data}) format("{fmt}"); }}')
+        self.page.add_style_tag(content="\n".join(faces))
+        loaded = self.page.evaluate(
+            "families => Promise.all(families.map(f => document.fonts.load('16px \"' + f + '\"')))"
+            ".then(results => results.map(r => r.length))", list(fonts))
+        missing = [font for font, n in zip(fonts, loaded) if not n]
+        if missing:
+            raise RuntimeError(f"Browser could not load: {', '.join(missing)}")
+
+
+def ink(image: Image.Image) -> Dict:
+    """Ink coverage and ink bounding box of a grayscale sample."""
+    dark = np.asarray(image.convert("L")) < 128
+    rows, cols = np.flatnonzero(dark.any(axis=1)), np.flatnonzero(dark.any(axis=0))
+    if not len(rows):
+        return {"ink": 0.0, "ink_w": 0, "ink_h": 0}
+    return {"ink": float(dark.mean()), "ink_w": int(cols[-1] - cols[0] + 1), "ink_h": int(rows[-1] - rows[0] + 1)}
+
+
+def compare_sample(browser: Image.Image, local: Image.Image) -> Dict:
+    b, l = ink(browser), ink(local)
+    return {
+        "dw": local.width - browser.width,
+        "dh": local.height - browser.height,
+        "ink_ratio": l["ink"] / b["ink"] if b["ink"] else float("nan"),
+        "ink_dw": l["ink_w"] - b["ink_w"],
+        "ink_dh": l["ink_h"] - b["ink_h"],
+    }
+
+
+def parity(browser, local, fonts: List[str], phrases: List[str], samples: int, seed: int = 0,
+           save_dir: Optional[Path] = None) -> Dict[str, List[Dict]]:
+    """Render the same sample_layout draws through both renderers; per-font list of differences."""
+    results = {}
+    for font in fonts:
+        rng = random.Random(f"{seed}:{font}")
+        results[font] = []
+        for i in range(samples):
+            text = rng.choice(phrases)
+            layout = local.sample_layout(text, rng)
+            b = Image.open(io.BytesIO(browser.render_layout(text, font, layout))).convert("L")
+            l = local.render_layout_image(text, font, layout)
+            results[font].append(compare_sample(b, l))
+            if save_dir is not None:
+                pair = Image.new("L", (b.width + l.width + 10, max(b.height, l.height)), 128)
+                pair.paste(b, (0, 0))
+                pair.paste(l, (b.width + 10, 0))
+                pair.save(save_dir / f"{font.replace(' ', '_')}_{i:03d}.png")
+    return results
+
+
+def summarize(rows: List[Dict]) -> str:
+    same = sum(r["dw"] == 0 and r["dh"] == 0 for r in rows) / len(rows)
+    ratios = [r["ink_ratio"] for r in rows if r["ink_ratio"] == r["ink_ratio"]]
+    return (f"same size {same:6.1%}  |dw| {statistics.mean(abs(r['dw']) for r in rows):6.1f}  "
+            f"|dh| {statistics.mean(abs(r['dh']) for r in rows):6.1f}  "
+            f"ink ratio {statistics.median(ratios) if ratios else float('nan'):5.2f}  "
+            f"|ink dh| {statistics.mean(abs(r['ink_dh']) for r in rows):6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render the same layouts with Chromium and with Pillow and report size/ink differences")
+    parser.add_argument("--font-dir", type=str, required=True, help="Local TTF/OTF directory")
+    parser.add_argument("--fonts", nargs="+", default=None, help="Families to check (default: first 3 found)")
+    parser.add_argument("--google", action="store_true",
+                        help="Let the browser load the families from Google Fonts instead of the local files")
+    parser.add_argument("--samples", type=int, default=20, help="Samples per font")
+    parser.add_argument("--phrases", type=str, default="phrases_10000.csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save-dir", type=Path, default=None, help="Write browser|local side-by-side pairs here")
+    args = parser.parse_args()
+
+    local = LocalFontDatasetGenerator(args.font_dir)
+    fonts = args.fonts or local.get_google_fonts(3)
+    local.start_browser(fonts)
+    browser = FontDatasetGenerator() if args.google else LocalFilesBrowserGenerator(local.font_files)
+    try:
+        browser.start_browser(fonts)
+    except Exception as e:
+        browser.stop_browser()
+        message = str(e).splitlines()[0] if str(e) else ""
+        print(f"skipped: browser renderer unavailable ({type(e).__name__}: {message})")
+        return
+
+    if args.save_dir is not None:
+        args.save_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        results = parity(browser, local, fonts, list(read_phrases(args.phrases)), args.samples, args.seed,
+                         args.save_dir)
+    finally:
+        browser.stop_browser()
+    # dw/dh: local minus browser crop size in px; ink ratio: local / browser dark-pixel share
+    for font, rows in results.items():
+        print(f"{font:24s} {summarize(rows)}")
+
+
+if __name__ == "__main__":
+    main()
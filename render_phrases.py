@@ -1,16 +1,49 @@
 from playwright.sync_api import sync_playwright
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, util
 from pathlib import Path
-import pandas as pd
+from PIL import Image, ImageFont
+from create_phrases import iter_phrases, read_phrases
+from phrase_selection import bucket_mix, coverage, dedup, select_phrases
+from render_manifest import RenderManifest
+from shards import CLASSES_FILE, ShardWriter
+import argparse
+import io
+import itertools
+import json
+import math
 import random
 import shutil
+import time
+
+# Per-process generator used by the parallel rendering pool
+_worker_generator = None
+
+def _init_worker(generator, fonts):
+    """Start one browser per pool process, closed when the process exits"""
+    global _worker_generator
+    _worker_generator = generator
+    generator.start_browser(fonts)
+    util.Finalize(None, generator.stop_browser, exitpriority=10)
+
+def _render_chunk(jobs, batch_size):
+    """Render a chunk of (font, text_idx, text) jobs in a pool process"""
+    return list(zip(jobs, _worker_generator.render_jobs(jobs, batch_size)))
 
 class FontDatasetGenerator:
-    def __init__(self, output_dir="data"):
+    # Rendered samples are committed (shards and manifest fsynced) after this many samples or
+    # seconds, whichever comes first; anything uncommitted is rendered again on resume
+    COMMIT_EVERY = 256
+    COMMIT_SECONDS = 5.0
+    
+    def __init__(self, output_dir="data", seed=None):
         self.output_dir = Path(output_dir)
-        self.output_dir.mkdir(exist_ok=True)
+        self.seed = seed
         self.playwright = None
         self.browser = None
         self.page = None
+        self.last_commit = time.monotonic()
         
     def get_google_fonts(self, limit=50):
         """Get list of popular Google Fonts"""
@@ -50,13 +83,14 @@ class FontDatasetGenerator:
             <style>
                 body {{ margin: 0; padding: 20px; }}
                 #container {{ background: white; }}
+                .sample {{ background: white; margin-bottom: 20px; }}
             </style>
         </head>
         <body>
             <div id="container"></div>
+            <div id="batch"></div>
             <script>
-                function renderText(text, fontFamily, containerWidth, fontSize, paddingTop, paddingRight, paddingBottom, paddingLeft, textAlign) {{
-                    const container = document.getElementById('container');
+                function styleContainer(container, text, fontFamily, containerWidth, fontSize, paddingTop, paddingRight, paddingBottom, paddingLeft, textAlign) {{
                     container.style.width = containerWidth + 'px';
                     container.style.fontFamily = '"' + fontFamily + '", sans-serif';
                     container.style.fontSize = fontSize + 'px';
@@ -66,6 +100,30 @@ class FontDatasetGenerator:
                     container.style.textAlign = textAlign;
                     container.textContent = text;
                 }}
+
+                function renderText(text, fontFamily, containerWidth, fontSize, paddingTop, paddingRight, paddingBottom, paddingLeft, textAlign) {{
+                    const container = document.getElementById('container');
+                    styleContainer(container, text, fontFamily, containerWidth, fontSize, paddingTop, paddingRight, paddingBottom, paddingLeft, textAlign);
+                }}
+
+                // Lay out one container per item and return their page-space bounding boxes
+                function renderBatch(items) {{
+                    document.getElementById('container').textContent = '';
+                    const batch = document.getElementById('batch');
+                    batch.replaceChildren();
+                    const containers = items.map(item => {{
+                        const container = document.createElement('div');
+                        container.className = 'sample';
+                        styleContainer(container, item.text, item.fontFamily, item.containerWidth, item.fontSize,
+                                       item.padding[0], item.padding[1], item.padding[2], item.padding[3], item.textAlign);
+                        batch.appendChild(container);
+                        return container;
+                    }});
+                    return containers.map(container => {{
+                        const rect = container.getBoundingClientRect();
+                        return {{ x: rect.left + window.scrollX, y: rect.top + window.scrollY, width: rect.width, height: rect.height }};
+                    }});
+                }}
             </script>
         </body>
         </html>
@@ -81,30 +139,45 @@ class FontDatasetGenerator:
             }
         """)
     
-    def render_font_sample(self, text, font_family):
-        """Render text with specified font in a container of random width and size"""
-        
-        font_size = random.randint(10, 100)
+    def sample_layout(self, text, rng=random):
+        """Pick random font size, padding, container width and alignment for a sample"""
+        font_size = rng.randint(10, 100)
         
         # Random padding for each side
-        padding_top = random.randint(0, 150)
-        padding_right = random.randint(0, 150)
-        padding_bottom = random.randint(0, 150)
-        padding_left = random.randint(0, 150)
+        padding_top = rng.randint(0, 150)
+        padding_right = rng.randint(0, 150)
+        padding_bottom = rng.randint(0, 150)
+        padding_left = rng.randint(0, 150)
 
         # Adjust container width based on text length
-        container_width = int(len(text) * font_size / 10. + random.randint(200, 800))
+        container_width = int(len(text) * font_size / 10. + rng.randint(200, 800))
         
         # Random text alignment
         alignments = ['left', 'center', 'right']
-        text_alignment = random.choice(alignments)
+        text_alignment = rng.choice(alignments)
+        
+        return {
+            'font_size': font_size,
+            'padding': [padding_top, padding_right, padding_bottom, padding_left],
+            'container_width': container_width,
+            'text_align': text_alignment,
+        }
+    
+    def render_font_sample(self, text, font_family, rng=random):
+        """Render text with specified font in a container of random width and size"""
+        layout = self.sample_layout(text, rng)
+        return self.render_layout(text, font_family, layout)
+    
+    def render_layout(self, text, font_family, layout):
+        """Render text with specified font using a layout from sample_layout"""
+        padding_top, padding_right, padding_bottom, padding_left = layout['padding']
         
         # Escape text for JavaScript
         escaped_text = text.replace('\\', '\\\\').replace('"', '\\"').replace("'", "\\'")
         
         # Render text in container
         self.page.evaluate(f'''
-            renderText("{escaped_text}", "{font_family}", {container_width}, {font_size}, {padding_top}, {padding_right}, {padding_bottom}, {padding_left}, "{text_alignment}")
+            renderText("{escaped_text}", "{font_family}", {layout['container_width']}, {layout['font_size']}, {padding_top}, {padding_right}, {padding_bottom}, {padding_left}, "{layout['text_align']}")
         ''')
         
         # Take screenshot of container
@@ -113,51 +186,420 @@ class FontDatasetGenerator:
         
         return screenshot
     
-    def load_phrases(self, csv_path="phrases_10000.csv"):
-        """Load phrases from CSV file"""
-        df = pd.read_csv(csv_path)
-        return df['phrase'].tolist()
+    def render_batch(self, items):
+        """Render (text, font_family, layout) items in one page and return one PNG per item"""
+        boxes = self.page.evaluate("items => renderBatch(items)", [
+            {
+                'text': text,
+                'fontFamily': font_family,
+                'containerWidth': layout['container_width'],
+                'fontSize': layout['font_size'],
+                'padding': layout['padding'],
+                'textAlign': layout['text_align'],
+            }
+            for text, font_family, layout in items
+        ])
+        
+        # Snap boxes to whole pixels the same way element screenshots do
+        boxes = [
+            (math.floor(b['x']), math.floor(b['y']), math.ceil(b['x'] + b['width']), math.ceil(b['y'] + b['height']))
+            for b in boxes
+        ]
+        
+        screenshots = [None] * len(boxes)
+        for group in self._capture_groups(boxes):
+            left = min(boxes[i][0] for i in group)
+            top = min(boxes[i][1] for i in group)
+            right = max(boxes[i][2] for i in group)
+            bottom = max(boxes[i][3] for i in group)
+            capture = self.page.screenshot(
+                full_page=True,
+                clip={'x': left, 'y': top, 'width': right - left, 'height': bottom - top},
+            )
+            
+            # Slice the capture into per-sample crops
+            with Image.open(io.BytesIO(capture)) as image:
+                for i in group:
+                    x0, y0, x1, y1 = boxes[i]
+                    buffer = io.BytesIO()
+                    image.crop((x0 - left, y0 - top, x1 - left, y1 - top)).save(buffer, format='PNG')
+                    screenshots[i] = buffer.getvalue()
+        
+        return screenshots
+    
+    def _capture_groups(self, boxes, max_height=8192):
+        """Group vertically stacked boxes so each capture stays under max_height pixels"""
+        groups, group, top = [], [], None
+        for i, (_, y0, _, y1) in enumerate(boxes):
+            if group and y1 - top > max_height:
+                groups.append(group)
+                group = []
+            if not group:
+                top = y0
+            group.append(i)
+        if group:
+            groups.append(group)
+        return groups
+    
+    def render_jobs(self, jobs, batch_size=1):
+        """Render (font, text_idx, text) jobs, batch_size samples per page capture.
+        Returns a (layout, screenshot) pair per job."""
+        layouts = [self.sample_layout(text, self.job_rng(font_family, text_idx))
+                   for font_family, text_idx, text in jobs]
+        items = [(text, font_family, layout) for (font_family, _, text), layout in zip(jobs, layouts)]
+        
+        if batch_size <= 1:
+            screenshots = [self.render_layout(*item) for item in items]
+        else:
+            screenshots = []
+            for i in range(0, len(items), batch_size):
+                screenshots.extend(self.render_batch(items[i:i + batch_size]))
+        return list(zip(layouts, screenshots))
     
-    def generate_samples(self, texts=None, fonts=None, samples_per_font=500):
-        """Generate font samples and save as images"""
-        # Clear existing data folder
-        if self.output_dir.exists():
+    def job_rng(self, font_family, text_idx):
+        """Random source for one sample, reproducible from the generator seed"""
+        if self.seed is None:
+            return random
+        return random.Random(f"{self.seed}:{font_family}:{text_idx}")
+    
+    def save_sample(self, font_family, text_idx, screenshot, layout=None, writer=None):
+        """Write a rendered sample into its font folder, or into shards if a ShardWriter is given"""
+        folder = font_family.replace(' ', '_')
+        filename = f"sample_{text_idx:02d}.png"
+        
+        if writer is not None:
+            writer.add(screenshot, writer.class_to_idx[folder], name=self.sample_name(font_family, text_idx),
+                       params=layout)
+            return filename
+        
+        with open(self.output_dir / folder / filename, 'wb') as f:
+            f.write(screenshot)
+        
+        return filename
+    
+    def load_phrases(self, source="phrases_10000.csv"):
+        """Load phrases from a CSV/Parquet file, or from a stream of phrases or (type, phrase) pairs
+        such as create_phrases.iter_phrases()"""
+        if isinstance(source, (str, Path)):
+            source = read_phrases(source)
+        return [p if isinstance(p, str) else p[1] for p in source]
+    
+    def render_params(self, output_format):
+        """Settings besides seed and phrase that change the rendered output, kept in the manifest"""
+        return {"renderer": type(self).__name__, "format": output_format}
+    
+    def generate_samples(self, texts=None, fonts=None, samples_per_font=500, workers=1, chunk_size=16,
+                         batch_size=1, output_format="png", samples_per_shard=4096, overwrite=False,
+                         phrases="phrases_10000.csv", select=False):
+        """Generate font samples and save as images (output_format="png") or shards (output_format="shards").
+        Samples already listed in the output's manifest are skipped unless overwrite is set.
+        With select, phrases are deduplicated and picked for glyph coverage instead of at random."""
+        if overwrite and self.output_dir.exists():
             print(f"Clearing existing data folder: {self.output_dir}")
             shutil.rmtree(self.output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
+        manifest = RenderManifest(self.output_dir, self.seed, self.render_params(output_format))
+        self.seed = manifest.seed
+        
         if texts is None:
-            all_phrases = self.load_phrases()
-            texts = random.sample(all_phrases, min(samples_per_font, len(all_phrases)))
+            all_phrases = self.load_phrases(phrases)
+            if select:
+                # Greedy picks are prefix-stable too, so resuming with a larger budget still works
+                texts = select_phrases(dedup(all_phrases), samples_per_font, seed=self.seed,
+                                       mix=bucket_mix(all_phrases))
+                print(f"Selected {len(texts)} of {len(all_phrases)} phrases for coverage: {coverage(texts)}")
+            else:
+                # A seeded permutation, so raising samples_per_font keeps the existing phrases
+                texts = random.Random(self.seed).sample(all_phrases, len(all_phrases))
         
         if fonts is None:
             fonts = self.get_google_fonts(20)
         
-        print(f"Generating samples for {len(fonts)} fonts...")
+        jobs = [
+            (font_family, text_idx, text)
+            for font_family in fonts
+            for text_idx, text in enumerate(texts[:samples_per_font])
+            if not self._is_rendered(manifest, font_family, text_idx, text, output_format)
+        ]
+        skipped = len(fonts) * min(samples_per_font, len(texts)) - len(jobs)
+        if skipped:
+            print(f"Skipping {skipped} samples already in {manifest.path}")
+        
+        writer = None
+        if output_format == "shards":
+            existing = set()
+            if (self.output_dir / CLASSES_FILE).exists():
+                with open(self.output_dir / CLASSES_FILE) as f:
+                    existing = set(json.load(f))
+            classes = sorted(existing | {font_family.replace(' ', '_') for font_family in fonts})
+            # Samples about to be re-rendered replace their old index records
+            writer = ShardWriter(self.output_dir, classes, samples_per_shard, append=True,
+                                 exclude={self.sample_name(font_family, text_idx) for font_family, text_idx, _ in jobs})
+        else:
+            for font_family in fonts:
+                (self.output_dir / font_family.replace(' ', '_')).mkdir(exist_ok=True)
         
+        print(f"Generating samples for {len(fonts)} fonts (seed {self.seed})...")
+        start = time.perf_counter()
+        self.last_commit = time.monotonic()
+        
+        try:
+            if workers > 1:
+                self._generate_parallel(jobs, fonts, workers, chunk_size, batch_size, writer, manifest)
+            else:
+                self._generate_serial(jobs, fonts, batch_size, writer, manifest)
+        finally:
+            if writer is not None:
+                writer.close()
+        
+        elapsed = time.perf_counter() - start
+        print(f"Rendered {len(jobs)} samples in {elapsed:.1f}s "
+              f"({len(jobs) / max(elapsed, 1e-9):.1f} samples/sec)")
+    
+    def sample_name(self, font_family, text_idx):
+        """Path of a sample relative to the output directory (its shard record name)"""
+        return f"{font_family.replace(' ', '_')}/sample_{text_idx:02d}.png"
+    
+    def _is_rendered(self, manifest, font_family, text_idx, text, output_format):
+        """Done in the manifest and, for PNG output, still on disk"""
+        if not manifest.is_done(font_family, text_idx, text):
+            return False
+        return output_format == "shards" or (self.output_dir / self.sample_name(font_family, text_idx)).exists()
+    
+    def _commit(self, writer, manifest):
+        """Flush rendered samples to disk, then mark them done in the manifest"""
+        if writer is not None:
+            writer.flush()
+        manifest.commit()
+        self.last_commit = time.monotonic()
+    
+    def _maybe_commit(self, writer, manifest):
+        """Commit once COMMIT_EVERY samples or COMMIT_SECONDS have piled up since the last commit"""
+        if manifest is None or not manifest.pending:
+            return
+        if (len(manifest.pending) >= self.COMMIT_EVERY
+                or time.monotonic() - self.last_commit >= self.COMMIT_SECONDS):
+            self._commit(writer, manifest)
+    
+    def _generate_serial(self, jobs, fonts, batch_size, writer=None, manifest=None):
+        """Render all jobs through this generator's single page"""
         try:
             self.start_browser(fonts)
             
-            for font_idx, font_family in enumerate(fonts):
-                print(f"Processing {font_family} ({font_idx+1}/{len(fonts)})")
-                
-                font_dir = self.output_dir / font_family.replace(' ', '_')
-                font_dir.mkdir(exist_ok=True)
-                
-                for text_idx, text in enumerate(texts[:samples_per_font]):
-                    screenshot = self.render_font_sample(text, font_family)
+            current_font = None
+            step = max(batch_size, 1)
+            for i in range(0, len(jobs), step):
+                batch = jobs[i:i + step]
+                for (font_family, text_idx, text), (layout, screenshot) in zip(batch, self.render_jobs(batch, batch_size)):
+                    if font_family != current_font:
+                        current_font = font_family
+                        print(f"Processing {font_family} ({fonts.index(font_family)+1}/{len(fonts)})")
                     
-                    filename = f"sample_{text_idx:02d}.png"
-                    filepath = font_dir / filename
-                    
-                    with open(filepath, 'wb') as f:
-                        f.write(screenshot)
-                        
+                    filename = self.save_sample(font_family, text_idx, screenshot, layout, writer)
+                    if manifest is not None:
+                        manifest.record(font_family, text_idx, text, self.sample_name(font_family, text_idx))
                     print(f"  Saved: {filename}")
+                self._maybe_commit(writer, manifest)
+            if manifest is not None:
+                self._commit(writer, manifest)
         
         finally:
             self.stop_browser()
+    
+    def _generate_parallel(self, jobs, fonts, workers, chunk_size, batch_size, writer=None, manifest=None):
+        """Spread jobs over a pool of processes, each with its own browser"""
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        print(f"Rendering {len(jobs)} samples with {workers} workers ({len(chunks)} chunks)")
+        
+        done = 0
+        start = time.perf_counter()
+        # At most two chunks per worker in flight: enough to keep every worker busy, while
+        # finished chunks waiting for in-order collection can't pile up in this process
+        max_in_flight = 2 * workers
+        chunk_iter = iter(chunks)
+        pending = deque()
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self, fonts))
+        try:
+            while True:
+                for chunk in itertools.islice(chunk_iter, max_in_flight - len(pending)):
+                    pending.append(pool.submit(_render_chunk, chunk, batch_size))
+                if not pending:
+                    break
+                # Collect in submission order so the output order is deterministic
+                results = pending.popleft().result()
+                for (font_family, text_idx, text), (layout, screenshot) in results:
+                    self.save_sample(font_family, text_idx, screenshot, layout, writer)
+                    if manifest is not None:
+                        manifest.record(font_family, text_idx, text, self.sample_name(font_family, text_idx))
+                self._maybe_commit(writer, manifest)
+                done += len(results)
+                rate = done / max(time.perf_counter() - start, 1e-9)
+                print(f"  {done}/{len(jobs)} samples ({rate:.1f} samples/sec)")
+            if manifest is not None:
+                self._commit(writer, manifest)
+        except BaseException:
+            # Don't render the queued chunks just to throw them away before the error surfaces
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+        pool.shutdown(wait=True)
+
+class LocalFontDatasetGenerator(FontDatasetGenerator):
+    """Render samples from local TTF/OTF files with Pillow instead of a browser"""
+    
+    FONT_SUFFIXES = ('.ttf', '.otf')
+    
+    def __init__(self, font_dir, output_dir="data", seed=None):
+        super().__init__(output_dir=output_dir, seed=seed)
+        self.font_dir = Path(font_dir)
+        self.font_files = self._find_font_files()
+        self.loaded_fonts = None
+    
+    def _find_font_files(self):
+        """Map family name to font file, preferring the Regular style of each family"""
+        font_files = {}
+        for path in sorted(self.font_dir.rglob('*')):
+            if path.suffix.lower() not in self.FONT_SUFFIXES:
+                continue
+            family, style = ImageFont.truetype(str(path), 10).getname()
+            if family not in font_files or style == 'Regular':
+                font_files[family] = path
+        return font_files
+    
+    def get_google_fonts(self, limit=50):
+        """Get list of font families found in the local font directory"""
+        return sorted(self.font_files)[:limit]
+    
+    def start_browser(self, fonts):
+        """Check that every font is available locally; fonts are loaded per size on demand"""
+        missing = [font for font in fonts if font not in self.font_files]
+        if missing:
+            raise ValueError(f"Fonts not found in {self.font_dir}: {', '.join(missing)}")
+        self.loaded_fonts = {}
+    
+    def stop_browser(self):
+        """Drop loaded font faces"""
+        self.loaded_fonts = None
+    
+    def _load_font(self, font_family, font_size):
+        """Font face plus a glyph cache, so each character is rasterized once per size"""
+        key = (font_family, font_size)
+        if key not in self.loaded_fonts:
+            font = ImageFont.truetype(
+                str(self.font_files[font_family]), font_size, layout_engine=ImageFont.Layout.BASIC)
+            self.loaded_fonts[key] = (font, {})
+        return self.loaded_fonts[key]
+    
+    def _glyph(self, face, char):
+        """(mask, offset, advance) for one character"""
+        font, glyphs = face
+        if char not in glyphs:
+            mask, offset = font.getmask2(char, mode='L')
+            image = Image.frombytes('L', mask.size, bytes(mask)) if mask.size[0] and mask.size[1] else None
+            glyphs[char] = (image, offset, font.getlength(char))
+        return glyphs[char]
+    
+    def _text_width(self, face, text):
+        return sum(self._glyph(face, char)[2] for char in text)
+    
+    def _wrap_text(self, text, face, width):
+        """Greedy word wrap to width, breaking words that do not fit on a line of their own"""
+        space = self._text_width(face, ' ')
+        lines, line, line_width = [], [], 0.0
+        for word in text.split():
+            word_width = self._text_width(face, word)
+            if line and line_width + space + word_width <= width:
+                line.append(word)
+                line_width += space + word_width
+                continue
+            if line:
+                lines.append(' '.join(line))
+            # Like CSS word-wrap: break-word, split overlong words at the last fitting character
+            while len(word) > 1 and word_width > width:
+                cut = len(word) - 1
+                while cut > 1 and self._text_width(face, word[:cut]) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = self._text_width(face, word)
+            line, line_width = [word], word_width
+        if line:
+            lines.append(' '.join(line))
+        return lines
+    
+    def render_layout(self, text, font_family, layout):
+        """Rasterize text with Pillow using a layout from sample_layout, as PNG bytes"""
+        buffer = io.BytesIO()
+        self.render_layout_image(text, font_family, layout).save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+    
+    def render_layout_image(self, text, font_family, layout):
+        """Rasterize text into a grayscale PIL image, skipping the PNG round-trip"""
+        padding_top, padding_right, padding_bottom, padding_left = layout['padding']
+        width = layout['container_width']
+        face = self._load_font(font_family, layout['font_size'])
+        
+        lines = self._wrap_text(text, face, width)
+        ascent, descent = face[0].getmetrics()
+        line_height = ascent + descent
+        
+        image = Image.new('L', (
+            width + padding_left + padding_right,
+            max(1, line_height * len(lines) + padding_top + padding_bottom),
+        ), 255)
+        for i, line in enumerate(lines):
+            slack = width - self._text_width(face, line)
+            x = padding_left + {'left': 0, 'center': slack / 2, 'right': slack}[layout['text_align']]
+            y = padding_top + i * line_height
+            for char in line:
+                mask, (dx, dy), advance = self._glyph(face, char)
+                if mask is not None:
+                    image.paste(0, (round(x) + dx, y + dy), mask)
+                x += advance
+        
+        return image
+    
+    def render_batch(self, items):
+        """No page round-trips to amortize; render each item directly"""
+        return [self.render_layout(text, font_family, layout) for text, font_family, layout in items]
+
+def main():
+    parser = argparse.ArgumentParser(description="Render font samples into a dataset folder")
+    parser.add_argument("--output-dir", type=str, default="data", help="Dataset root (one folder per font)")
+    parser.add_argument("--samples-per-font", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=1, help="Renderer processes (one browser each)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="Samples per job sent to a worker")
+    parser.add_argument("--batch-size", type=int, default=1, help="Samples laid out per page capture")
+    parser.add_argument("--font-dir", type=str, default=None,
+                        help="Render offline from local TTF/OTF files with Pillow instead of Google Fonts")
+    parser.add_argument("--format", choices=["png", "shards"], default="png",
+                        help="One PNG per sample, or packed shards with an index")
+    parser.add_argument("--samples-per-shard", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Make phrase choice and layouts reproducible (default: reuse the manifest's seed)")
+    parser.add_argument("--phrases", type=str, default="phrases_10000.csv", help="Phrase file (.csv or .parquet)")
+    parser.add_argument("--generate-phrases", type=int, default=None, metavar="N",
+                        help="Stream N phrases from create_phrases instead of reading --phrases")
+    parser.add_argument("--select", action="store_true",
+                        help="Drop near-duplicate phrases and pick the rest for character/bigram coverage")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Delete the output directory first instead of resuming from its manifest")
+    args = parser.parse_args()
+
+    phrases = args.phrases
+    if args.generate_phrases:
+        phrases = iter_phrases(args.generate_phrases, seed=42 if args.seed is None else args.seed)
+    
+    if args.font_dir:
+        generator = LocalFontDatasetGenerator(args.font_dir, output_dir=args.output_dir, seed=args.seed)
+    else:
+        generator = FontDatasetGenerator(output_dir=args.output_dir, seed=args.seed)
+    generator.generate_samples(samples_per_font=args.samples_per_font,
+                               workers=args.workers, chunk_size=args.chunk_size,
+                               batch_size=args.batch_size, output_format=args.format,
+                               samples_per_shard=args.samples_per_shard, overwrite=args.overwrite,
+                               phrases=phrases, select=args.select)
 
 if __name__ == "__main__":
-    generator = FontDatasetGenerator()
-    generator.generate_samples()
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import io
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import torch
+from PIL import Image
+
+from inference import get_device, input_channels, load_model, make_transforms, predict
+from prediction_cache import PredictionCache, cache_namespace, image_key
+
+
+class MicroBatcher:
+    """Collects concurrent requests into batches of at most max_batch_size, waiting at most
+    max_wait_ms after the first request of a batch, and runs them through the model."""
+
+    def __init__(self, model, classes, device: torch.device, img_size: int,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0, cache=None):
+        self.model = model
+        self.classes = classes
+        self.device = device
+        self.tfms = make_transforms(img_size, input_channels(model))
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.errors = 0
+        # Optional PredictionCache; hits are answered in submit() without decoding or queueing
+        self.cache = cache
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image_bytes: bytes, topk: int) -> Future:
+        topk = min(topk, len(self.classes))
+        future = Future()
+        key = None
+        if self.cache is not None:
+            key = image_key(image_bytes, f"top{topk}")
+            cached = self.cache.get(key)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+        # Decode and transform in the caller's (request handler) thread
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            tensor = self.tfms(img.convert("RGB"))
+        self.queue.put((tensor, topk, key, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            tensors, topks, keys, futures = zip(*batch)
+            try:
+                confs, idxs = predict(self.model, torch.stack(tensors), self.device, max(topks))
+            except Exception as e:
+                with self.lock:
+                    self.errors += len(batch)
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+                self.requests += len(batch)
+            results = [
+                [{"class": self.classes[idxs[i, j].item()], "prob": float(confs[i, j].item())} for j in range(k)]
+                for i, k in enumerate(topks)
+            ]
+            for future, result in zip(futures, results):
+                future.set_result(result)
+            if self.cache is not None:
+                self.cache.put_many(zip(keys, results))
+
+    def metrics(self) -> dict:
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "requests": self.requests,
+                "errors": self.errors,
+                "batches": sum(self.batch_sizes.values()),
+                "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+                "cache": self.cache.metrics() if self.cache is not None else None,
+            }
+
+
+class PredictHandler(BaseHTTPRequestHandler):
+    batcher: MicroBatcher = None
+    default_topk = 5
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.batcher.metrics())
+        elif path == "/health":
+            self._send_json(200, {"status": "ok", "classes": len(self.batcher.classes)})
+        else:
+            self._send_json(404, {"error": f"unknown path {path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/predict":
+            self._send_json(404, {"error": f"unknown path {url.path}"})
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            topk = int(parse_qs(url.query).get("topk", [self.default_topk])[0])
+        except ValueError:
+            self._send_json(400, {"error": "topk must be an integer"})
+            return
+        if topk < 1:
+            self._send_json(400, {"error": "topk must be at least 1"})
+            return
+        try:
+            future = self.batcher.submit(body, topk)
+        except Exception as e:
+            self._send_json(400, {"error": f"{type(e).__name__}: {e}"})
+            return
+        try:
+            self._send_json(200, {"topk": future.result()})
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Font classifier server with dynamic micro-batching")
+    parser.add_argument("--ckpt", type=Path, required=True, help="Path to best.ckpt.pt")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", type=Path, default=None, help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long the first request of a batch waits for others")
+    parser.add_argument("--topk", type=int, default=5, help="Default top-K when the request has no ?topk=")
+    parser.add_argument("--img-size", type=int, default=224, help="Model input size")
+    parser.add_argument("--device", type=str, choices=["auto", "cpu", "cuda", "mps"], default="auto")
+    parser.add_argument("--cache", action="store_true",
+                        help="Answer byte-identical images from a prediction cache (in memory)")
+    parser.add_argument("--cache-db", type=Path, default=None,
+                        help="Also keep cached predictions in this SQLite file across restarts (implies --cache)")
+    parser.add_argument("--cache-mb", type=int, default=64, help="In-memory cache size")
+    args = parser.parse_args()
+
+    device = get_device() if args.device == "auto" else torch.device(args.device)
+    model, classes = load_model(args.ckpt, device)
+    cache = None
+    if args.cache or args.cache_db:
+        cache = PredictionCache(cache_namespace(args.ckpt, args.img_size), args.cache_mb << 20, args.cache_db)
+
+    PredictHandler.batcher = MicroBatcher(model, classes, device, args.img_size,
+                                          args.max_batch_size, args.max_wait_ms, cache)
+    PredictHandler.default_topk = args.topk
+
+    if args.unix_socket:
+        if args.unix_socket.exists():
+            os.unlink(args.unix_socket)
+        server = ThreadingUnixHTTPServer(str(args.unix_socket), PredictHandler)
+        where = f"unix:{args.unix_socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), PredictHandler)
+        where = f"http://{args.host}:{args.port}"
+
+    print(f"Serving {len(classes)} classes on {where} (device={device}, "
+          f"max_batch_size={args.max_batch_size}, max_wait_ms={args.max_wait_ms})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import io
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from PIL import Image
+
+try:
+    from torch.utils.data import Dataset
+except ImportError:  # rendering machines only need the writer
+    Dataset = object
+
+IMG_EXTENSIONS = (".jpg", ".jpeg", ".png", ".ppm", ".bmp", ".pgm", ".tif", ".tiff", ".webp")
+INDEX_FILE = "index.jsonl"
+CLASSES_FILE = "classes.json"
+
+
+def shard_name(shard: int) -> str:
+    return f"shard-{shard:05d}.bin"
+
+
+class ShardWriter:
+    """Append encoded images to fixed-size shard files with a JSONL index of offsets,
+    labels and render parameters.
+
+    With append=True an existing shard directory is extended: its records are relabeled
+    for the new classes (minus any whose name is in exclude, e.g. samples about to be
+    re-rendered) and new samples go into fresh shards after the existing ones.
+    """
+
+    def __init__(self, root: Path, classes: List[str], samples_per_shard: int = 4096,
+                 append: bool = False, exclude: Iterable[str] = ()):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.classes = list(classes)
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+        self.samples_per_shard = samples_per_shard
+        self.count = 0
+        self.shard = -1
+        self.offset = 0
+        self.shard_file = None
+
+        records = []
+        if append and (self.root / INDEX_FILE).exists():
+            records = self._existing_records(set(exclude))
+            self.shard = max((r["shard"] for r in records), default=-1)
+            for path in self.root.glob("shard-*.bin"):
+                self.shard = max(self.shard, int(path.stem.split("-")[1]))
+
+        with open(self.root / CLASSES_FILE, "w") as f:
+            json.dump(self.classes, f)
+        tmp = self.root / (INDEX_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+        os.replace(tmp, self.root / INDEX_FILE)
+        self.index_file = open(self.root / INDEX_FILE, "a")
+
+    def _existing_records(self, exclude) -> List[Dict]:
+        with open(self.root / CLASSES_FILE) as f:
+            old_classes = json.load(f)
+        missing = set(old_classes) - set(self.classes)
+        if missing:
+            raise ValueError(f"Cannot append to {self.root}: classes {sorted(missing)} would be dropped")
+        sizes = {int(p.stem.split("-")[1]): p.stat().st_size for p in self.root.glob("shard-*.bin")}
+        records = []
+        with open(self.root / INDEX_FILE) as f:
+            for line in f:
+                try:
+                    r = json.loads(line)
+                except json.JSONDecodeError:  # torn last line from an interrupted run
+                    continue
+                # Skip excluded names and records whose bytes never reached the shard file
+                if r.get("name") in exclude or r["offset"] + r["length"] > sizes.get(r["shard"], 0):
+                    continue
+                r["label"] = self.class_to_idx[old_classes[r["label"]]]
+                records.append(r)
+        return records
+
+    def _next_shard(self):
+        if self.shard_file:
+            self.shard_file.close()
+        self.shard += 1
+        self.offset = 0
+        self.shard_file = open(self.root / shard_name(self.shard), "wb")
+
+    def add(self, data: bytes, label: int, name: Optional[str] = None, params: Optional[Dict] = None):
+        if self.count % self.samples_per_shard == 0:
+            self._next_shard()
+        self.shard_file.write(data)
+        record = {"shard": self.shard, "offset": self.offset, "length": len(data), "label": label}
+        if name is not None:
+            record["name"] = name
+        if params is not None:
+            record["params"] = params
+        self.index_file.write(json.dumps(record) + "\n")
+        self.offset += len(data)
+        self.count += 1
+
+    def flush(self):
+        """Make everything added so far durable on disk, e.g. before recording it elsewhere."""
+        for f in (self.shard_file, self.index_file):
+            if f:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        if self.shard_file:
+            self.shard_file.close()
+            self.shard_file = None
+        self.index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_index(root: Path) -> List[Dict]:
+    with open(Path(root) / INDEX_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ShardDataset(Dataset):
+    """Map-style dataset over a shard directory, a drop-in for ImageFolder.
+
+    Shards are memory-mapped lazily in each process, so no file is opened or
+    stat'ed per sample.
+    """
+
+    def __init__(self, root: Path, transform=None, target_transform=None):
+        self.root = Path(root)
+        self.transform = transform
+        self.target_transform = target_transform
+        with open(self.root / CLASSES_FILE) as f:
+            self.classes = json.load(f)
+        self.class_to_idx = {c: i for i, c in enumerate(self.classes)}
+
+        records = read_index(self.root)
+        self.shards = np.array([r["shard"] for r in records], dtype=np.int32)
+        self.offsets = np.array([r["offset"] for r in records], dtype=np.int64)
+        self.lengths = np.array([r["length"] for r in records], dtype=np.int64)
+        self.targets = [r["label"] for r in records]
+        self._maps = {}
+        self._pid = None
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def _shard_map(self, shard: int) -> mmap.mmap:
+        # DataLoader workers must map their own copies
+        if self._pid != os.getpid():
+            self._maps, self._pid = {}, os.getpid()
+        if shard not in self._maps:
+            with open(self.root / shard_name(shard), "rb") as f:
+                self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[shard]
+
+    def read_bytes(self, index: int) -> bytes:
+        start = int(self.offsets[index])
+        return self._shard_map(int(self.shards[index]))[start:start + int(self.lengths[index])]
+
+    def __getitem__(self, index: int):
+        img = Image.open(io.BytesIO(self.read_bytes(index))).convert("RGB")
+        target = self.targets[index]
+        if self.transform is not None:
+            img = self.transform(img)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return img, target
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"], state["_pid"] = {}, None
+        return state
+
+
+def convert_image_folder(data_dir: Path, out_dir: Path, samples_per_shard: int = 4096) -> int:
+    """Pack an ImageFolder tree (data/<Font>/*.png) into shards, in ImageFolder order."""
+    data_dir = Path(data_dir)
+    classes = sorted(e.name for e in os.scandir(data_dir) if e.is_dir())
+    with ShardWriter(out_dir, classes, samples_per_shard) as writer:
+        for label, cls in enumerate(classes):
+            for root, _, fnames in sorted(os.walk(data_dir / cls, followlinks=True)):
+                for fname in sorted(fnames):
+                    if not fname.lower().endswith(IMG_EXTENSIONS):
+                        continue
+                    path = Path(root) / fname
+                    writer.add(path.read_bytes(), label, name=str(path.relative_to(data_dir)))
+        return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert an ImageFolder dataset into shards")
+    parser.add_argument("data_dir", type=Path, help="ImageFolder root, e.g. data/")
+    parser.add_argument("out_dir", type=Path, help="Shard directory to write")
+    parser.add_argument("--samples-per-shard", type=int, default=4096)
+    args = parser.parse_args()
+
+    count = convert_image_folder(args.data_dir, args.out_dir, args.samples_per_shard)
+    print(f"Wrote {count} samples to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
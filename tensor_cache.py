@@ -0,0 +1,258 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from torchvision import datasets, transforms
+from torchvision.transforms import functional as TF
+
+from inference import IMAGENET_MEAN, IMAGENET_STD
+from shards import INDEX_FILE, CLASSES_FILE, ShardDataset
+
+META_FILE = "meta.json"
+IMAGES_FILE = "images.npy"
+LABELS_FILE = "labels.npy"
+
+
+def working_size(img_size: int) -> int:
+    # Same short-side resize inference.make_transforms uses before the center crop
+    return int(img_size * 1.15)
+
+
+def open_source(source: Path, transform=None) -> Dataset:
+    """ImageFolder for data/<Font>/ trees, ShardDataset for shard directories."""
+    source = Path(source)
+    if (source / INDEX_FILE).exists():
+        return ShardDataset(source, transform=transform)
+    return datasets.ImageFolder(source, transform=transform)
+
+
+def source_fingerprint(source: Path) -> str:
+    """Hash of file names, sizes and mtimes; changes whenever the source dataset does."""
+    source = Path(source)
+    h = hashlib.sha1()
+    if (source / INDEX_FILE).exists():
+        paths = [source / INDEX_FILE, source / CLASSES_FILE]
+    else:
+        paths = [Path(root) / f for root, _, fnames in sorted(os.walk(source, followlinks=True))
+                 for f in sorted(fnames)]
+    for p in paths:
+        st = p.stat()
+        h.update(f"{p.relative_to(source)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+class AlignedCrop:
+    """Crop a size x size square around where CenterCrop(img_size) would land, so that
+    val_transform's center crop of the cached square is pixel-identical to it."""
+
+    def __init__(self, img_size: int, size: int):
+        self.img_size = img_size
+        self.size = size
+        self.margin = (size - img_size) // 2
+
+    def __call__(self, img: Image.Image) -> Image.Image:
+        w, h = img.size
+        top = int(round((h - self.img_size) / 2.0)) - self.margin
+        left = int(round((w - self.img_size) / 2.0)) - self.margin
+        return TF.crop(img, top, left, self.size, self.size)
+
+
+def make_decode_transform(img_size: int):
+    size = working_size(img_size)
+    return transforms.Compose([
+        transforms.Grayscale(1),
+        transforms.Resize(size, antialias=True),
+        AlignedCrop(img_size, size),
+        transforms.PILToTensor(),
+    ])
+
+
+def build_cache(source: Path, cache_dir: Path, img_size: int,
+                num_workers: int = 0, batch_size: int = 64) -> Path:
+    """Decode every source image once into a (N, S, S) uint8 memmap plus labels."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / META_FILE).unlink(missing_ok=True)
+
+    ds = open_source(source, transform=make_decode_transform(img_size))
+    size = working_size(img_size)
+    images = np.lib.format.open_memmap(cache_dir / IMAGES_FILE, mode="w+", dtype=np.uint8,
+                                       shape=(len(ds), size, size))
+    labels = np.empty(len(ds), dtype=np.int64)
+
+    loader = DataLoader(ds, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    pos = 0
+    for batch, targets in loader:
+        n = batch.size(0)
+        images[pos:pos + n] = batch[:, 0].numpy()
+        labels[pos:pos + n] = targets.numpy()
+        pos += n
+    images.flush()
+    del images
+    np.save(cache_dir / LABELS_FILE, labels)
+
+    # meta.json is written last and marks the cache as complete
+    with open(cache_dir / META_FILE, "w") as f:
+        json.dump({
+            "fingerprint": source_fingerprint(source),
+            "img_size": img_size,
+            "size": size,
+            "count": len(labels),
+            "classes": ds.classes,
+        }, f)
+    return cache_dir
+
+
+def cache_is_valid(source: Path, cache_dir: Path, img_size: int) -> bool:
+    meta_path = Path(cache_dir) / META_FILE
+    if not meta_path.exists():
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta["img_size"] == img_size and meta["fingerprint"] == source_fingerprint(source)
+
+
+class CachedImages(Dataset):
+    """Pre-decoded grayscale images; items are (1xSxS uint8 tensor, label)."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / META_FILE) as f:
+            meta = json.load(f)
+        self.classes = meta["classes"]
+        self.img_size = meta["img_size"]
+        self.targets = np.load(self.cache_dir / LABELS_FILE).tolist()
+        self._images = None
+        self._pid = None
+
+    @property
+    def images(self) -> np.ndarray:
+        # Map lazily so DataLoader workers each open their own read-only view
+        if self._pid != os.getpid():
+            self._images = np.load(self.cache_dir / IMAGES_FILE, mmap_mode="r")
+            self._pid = os.getpid()
+        return self._images
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __getitem__(self, index: int):
+        return torch.from_numpy(np.array(self.images[index]))[None], self.targets[index]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"], state["_pid"] = None, None
+        return state
+
+
+def load_cache(source: Path, cache_dir: Path, img_size: int, num_workers: int = 0) -> CachedImages:
+    """Open the cache for source, rebuilding it if the source or img_size changed."""
+    if not cache_is_valid(source, cache_dir, img_size):
+        print(f"Building tensor cache {cache_dir} from {source} (img_size={img_size})")
+        build_cache(source, cache_dir, img_size, num_workers=num_workers)
+    return CachedImages(cache_dir)
+
+
+def normalize(batch: torch.Tensor, in_channels: int = 3) -> torch.Tensor:
+    """(B,1,H,W) float in [0,1] -> (B,3,H,W) with ImageNet normalization.
+    1-channel models fold normalization into their stem and take the batch as is."""
+    if in_channels == 1:
+        return batch
+    mean = batch.new_tensor(IMAGENET_MEAN).view(1, 3, 1, 1)
+    std = batch.new_tensor(IMAGENET_STD).view(1, 3, 1, 1)
+    return (batch - mean) / std
+
+
+def val_transform(batch: torch.Tensor, img_size: int, in_channels: int = 3) -> torch.Tensor:
+    """Center crop a uint8 batch to img_size and normalize, matching inference.make_transforms
+    (and train2.ipynb's val_tfms; train.ipynb resizes to a fixed 256 instead)."""
+    h, w = batch.shape[-2:]
+    top, left = (h - img_size) // 2, (w - img_size) // 2
+    crop = batch[..., top:top + img_size, left:left + img_size]
+    return normalize(crop.float().div_(255), in_channels)
+
+
+def _random_crop_affine(n: int, generator=None, scale: Tuple[float, float] = (0.8, 1.0),
+                        ratio: Tuple[float, float] = (3 / 4, 4 / 3), degrees: float = 2.0,
+                        translate: float = 0.02, shear: float = 2.0) -> torch.Tensor:
+    """Per-sample (n,2,3) affine_grid matrices combining RandomResizedCrop and RandomAffine."""
+    def uniform(lo, hi):
+        return torch.empty(n).uniform_(lo, hi, generator=generator)
+
+    area = uniform(*scale)
+    log_ratio = uniform(math.log(ratio[0]), math.log(ratio[1]))
+    w = torch.sqrt(area * torch.exp(log_ratio)).clamp(max=1.0)
+    h = torch.sqrt(area / torch.exp(log_ratio)).clamp(max=1.0)
+    cx = (torch.rand(n, generator=generator) * 2 - 1) * (1 - w)
+    cy = (torch.rand(n, generator=generator) * 2 - 1) * (1 - h)
+
+    theta = torch.deg2rad(uniform(-degrees, degrees))
+    sh = torch.deg2rad(uniform(-shear, shear))
+    cos, sin, tan = torch.cos(theta), torch.sin(theta), torch.tan(sh)
+
+    # rotation @ shear(x), then scale to the crop box and shift to its center
+    mats = torch.zeros(n, 2, 3)
+    mats[:, 0, 0] = w * cos
+    mats[:, 0, 1] = w * (cos * tan - sin)
+    mats[:, 1, 0] = h * sin
+    mats[:, 1, 1] = h * (sin * tan + cos)
+    mats[:, 0, 2] = cx + uniform(-translate, translate) * 2
+    mats[:, 1, 2] = cy + uniform(-translate, translate) * 2
+    return mats
+
+
+def _gaussian_blur(batch: torch.Tensor, sigma: torch.Tensor) -> torch.Tensor:
+    """3x3 Gaussian blur with a separate sigma per sample."""
+    coords = batch.new_tensor([-1.0, 0.0, 1.0])
+    k1d = torch.exp(-(coords[None] ** 2) / (2 * sigma[:, None] ** 2))
+    k1d = k1d / k1d.sum(dim=1, keepdim=True)
+    kernels = (k1d[:, :, None] * k1d[:, None, :])[:, None]
+    n, c, h, w = batch.shape
+    out = F.conv2d(F.pad(batch.reshape(1, n * c, h, w), (1, 1, 1, 1), mode="reflect"),
+                   kernels.repeat_interleave(c, dim=0), groups=n * c)
+    return out.reshape(n, c, h, w)
+
+
+def train_augment(batch: torch.Tensor, img_size: int, blur_p: float = 0.15,
+                  generator=None, in_channels: int = 3) -> torch.Tensor:
+    """Batched on-device version of the notebooks' train_tfms for a (B,1,S,S) uint8 batch."""
+    n = batch.size(0)
+    x = 1.0 - batch.float().div_(255)  # invert so grid_sample's zero padding fills white
+    mats = _random_crop_affine(n, generator=generator).to(x.device)
+    grid = F.affine_grid(mats, [n, 1, img_size, img_size], align_corners=False)
+    x = 1.0 - F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    blur = torch.rand(n, generator=generator) < blur_p
+    if blur.any():
+        idx = blur.nonzero().squeeze(1).to(x.device)
+        sigma = torch.empty(int(blur.sum())).uniform_(0.1, 2.0, generator=generator).to(x.device)
+        x[idx] = _gaussian_blur(x[idx], sigma)
+    return normalize(x, in_channels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-decode a dataset into a uint8 tensor cache")
+    parser.add_argument("source", type=Path, help="ImageFolder root or shard directory")
+    parser.add_argument("cache_dir", type=Path)
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--num-workers", type=int, default=0)
+    args = parser.parse_args()
+
+    if cache_is_valid(args.source, args.cache_dir, args.img_size):
+        print(f"Cache {args.cache_dir} is up to date")
+        return
+    build_cache(args.source, args.cache_dir, args.img_size, num_workers=args.num_workers)
+    print(f"Wrote cache {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = total - w0
+    m0 = np.cumsum(hist * levels)
+    mu0 = m0 / np.maximum(w0, 1)
+    mu1 = (m0[-1] - m0) / np.maximum(w1, 1)
+    between = w0 * w1 * (mu0 - mu1) ** 2
+    return int(np.argmax(between))
+
+
+def binarize(gray: np.ndarray) -> np.ndarray:
+    """Ink mask; the minority side of the Otsu threshold is ink, so light-on-dark text works too."""
+    t = otsu_threshold(gray)
+    dark = gray <= t
+    return dark if dark.mean() < 0.5 else ~dark
+
+
+def _runs(mask: np.ndarray, max_gap: int) -> List[Tuple[int, int]]:
+    """[start, end) runs of True in a 1-D mask, bridging gaps of up to max_gap."""
+    idx = np.flatnonzero(mask)
+    if idx.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > max_gap + 1)
+    starts = np.concatenate([[idx[0]], idx[breaks + 1]])
+    ends = np.concatenate([idx[breaks], [idx[-1]]]) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def find_text_regions(img: Image.Image, work_size: int = 1024, block_gap: float = 1.0,
+                      col_gap: float = 2.0, pad: float = 0.5, min_height: int = 6,
+                      max_regions: int = 16) -> List[Box]:
+    """Text blocks found with projection profiles over the binarized image.
+
+    Rows with ink form line bands; bands closer than block_gap line heights merge into blocks;
+    within a block, columns with ink are split where the gap exceeds col_gap line heights.
+    Boxes are padded by pad line heights (the classifier is trained on padded renders) and
+    returned largest first, in original image coordinates.
+    """
+    gray = img.convert("L")
+    scale = min(1.0, work_size / max(gray.size))
+    if scale < 1.0:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.BILINEAR)
+    ink = binarize(np.asarray(gray))
+
+    row_ink = ink.sum(axis=1)
+    lines = _runs(row_ink > max(1, 0.002 * ink.shape[1]), max_gap=1)
+    lines = [(a, b) for a, b in lines if b - a >= max(2, min_height * scale)]
+    if not lines:
+        return []
+    line_height = float(np.median([b - a for a, b in lines]))
+
+    # Merge line bands into blocks
+    blocks = [list(lines[0])]
+    for a, b in lines[1:]:
+        if a - blocks[-1][1] <= block_gap * line_height:
+            blocks[-1][1] = b
+        else:
+            blocks.append([a, b])
+
+    boxes = []
+    for top, bottom in blocks:
+        col_ink = ink[top:bottom].sum(axis=0)
+        for left, right in _runs(col_ink > 0, max_gap=int(col_gap * line_height)):
+            if right - left < line_height:
+                continue
+            p = pad * line_height
+            boxes.append((
+                max(0, int((left - p) / scale)),
+                max(0, int((top - p) / scale)),
+                min(img.width, int(np.ceil((right + p) / scale))),
+                min(img.height, int(np.ceil((bottom + p) / scale))),
+                int(ink[top:bottom, left:right].sum()),
+            ))
+
+    boxes.sort(key=lambda b: b[4], reverse=True)
+    return [b[:4] for b in boxes[:max_regions]]
+
+
+class RegionCrops:
+    """Transform for a whole page: (crops tensor (K,C,H,W), per-crop weights (K,)).
+
+    Weights are proportional to crop area, so larger text blocks count more in the vote.
+    Pages with no detected text fall back to the full image.
+    """
+
+    def __init__(self, tfms, max_regions: int = 16, **region_kwargs):
+        self.tfms = tfms
+        self.region_kwargs = dict(region_kwargs, max_regions=max_regions)
+
+    def __call__(self, img: Image.Image):
+        boxes = find_text_regions(img, **self.region_kwargs) or [(0, 0, img.width, img.height)]
+        crops = torch.stack([self.tfms(img.crop(box)) for box in boxes])
+        areas = torch.tensor([float((r - l) * (b - t)) for l, t, r, b in boxes])
+        return crops, areas / areas.sum()
+
+
+def collate_regions(items: Sequence[Tuple[torch.Tensor, torch.Tensor]]):
+    """Concatenate the crops of several pages into one batch for a single forward pass."""
+    crops, weights = zip(*items)
+    return torch.cat(crops), [c.size(0) for c in crops], torch.cat(weights)
+
+
+def page_vote(probs: torch.Tensor, sizes: List[int], weights: torch.Tensor) -> torch.Tensor:
+    """Weighted mean of per-crop probabilities per page -> (num_pages, num_classes)."""
+    weighted = probs * weights.to(probs)[:, None]
+    return torch.stack([chunk.sum(dim=0) for chunk in weighted.split(sizes)])
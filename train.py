@@ -0,0 +1,375 @@
+import argparse
+import json
+import math
+import os
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+import torch.distributed as dist
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel as DDP
+from torch.utils.data import DataLoader, Dataset, DistributedSampler, IterableDataset
+from torchvision import transforms
+
+from inference import IMAGENET_MEAN, IMAGENET_STD, build_model, get_device, make_transforms
+
+
+def make_train_transforms(img_size: int, in_channels: int = 3) -> transforms.Compose:
+    """The notebooks' train_tfms; 1-channel models skip Grayscale(3) and Normalize like make_transforms."""
+    tfms = [
+        transforms.Grayscale(in_channels),
+        transforms.RandomResizedCrop(img_size, scale=(0.8, 1.0), antialias=True),
+        transforms.RandomAffine(degrees=2, translate=(0.02, 0.02), shear=(-2, 2), fill=255),
+        transforms.RandomApply([transforms.GaussianBlur(kernel_size=3)], p=0.15),
+        transforms.ToTensor(),
+    ]
+    if in_channels == 3:
+        tfms.append(transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD))
+    return transforms.Compose(tfms)
+
+
+def split_indices(n_total: int, val_split: float, seed: int) -> Tuple[List[int], List[int]]:
+    """The notebooks' split: a randperm under SEED, the last ceil(n * val_split) indices for validation."""
+    n_val = int(math.ceil(n_total * val_split))
+    g = torch.Generator().manual_seed(seed)
+    perm = torch.randperm(n_total, generator=g).tolist()
+    return perm[:n_total - n_val], perm[n_total - n_val:]
+
+
+class SplitDataset(Dataset):
+    """A subset of a shared base dataset with its own transform (no deepcopy per split)."""
+
+    def __init__(self, base: Dataset, indices: List[int], transform=None):
+        self.base = base
+        self.indices = indices
+        self.transform = transform
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index: int):
+        img, target = self.base[self.indices[index]]
+        if self.transform is not None:
+            img = self.transform(img)
+        return img, target
+
+
+def loader_kwargs(workers: int, prefetch: int, device: torch.device) -> dict:
+    kwargs = {"num_workers": workers, "pin_memory": device.type == "cuda"}
+    if workers > 0:
+        kwargs.update(persistent_workers=True, prefetch_factor=prefetch)
+    return kwargs
+
+
+def setup_distributed(device_type: str, backend: str = "auto") -> Tuple[int, int, int]:
+    """(rank, world_size, local_rank) from the torchrun environment, initializing the process
+    group when there is more than one process. Gloo unless NCCL is asked for or training on CUDA."""
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size <= 1:
+        return 0, 1, 0
+    if backend == "auto":
+        backend = "nccl" if device_type == "cuda" else "gloo"
+    dist.init_process_group(backend)
+    return dist.get_rank(), dist.get_world_size(), int(os.environ.get("LOCAL_RANK", 0))
+
+
+def build_datasets(args, in_channels: int, local_rank: int = 0):
+    """(train_ds, val_ds, classes, train_gpu_tfm, val_gpu_tfm); the GPU transforms are only set
+    for a tensor cache, whose uint8 batches are cropped and augmented on the device."""
+    if args.render_online:
+        from create_phrases import read_phrases
+        from render_dataset import RenderedFontDataset, make_generator, split_phrases
+
+        generator = make_generator(args.font_dir)
+        fonts = generator.get_google_fonts(args.num_fonts)
+        train_phrases, val_phrases = split_phrases(list(read_phrases(args.phrases)), args.val_split, args.seed)
+        train_ds = RenderedFontDataset(generator, fonts, train_phrases, args.samples_per_epoch,
+                                       make_train_transforms(args.img_size, in_channels), seed=args.seed,
+                                       shuffle_buffer=args.shuffle_buffer, group_size=args.render_group)
+        # A fixed validation set, rendered from held-out phrases
+        val_ds = RenderedFontDataset(generator, fonts, val_phrases, args.val_samples,
+                                     make_transforms(args.img_size, in_channels), seed=args.seed + 1,
+                                     shuffle_buffer=0, group_size=args.render_group, fixed=True)
+        return train_ds, val_ds, train_ds.classes, None, None
+
+    if args.cache:
+        from tensor_cache import load_cache, train_augment, val_transform
+
+        # One process per node builds a stale cache while the others wait for it
+        distributed = dist.is_available() and dist.is_initialized()
+        if distributed and local_rank != 0:
+            dist.barrier()
+        base = load_cache(args.data, args.cache, args.img_size, num_workers=args.workers)
+        if distributed and local_rank == 0:
+            dist.barrier()
+        train_idx, val_idx = split_indices(len(base), args.val_split, args.seed)
+        return (SplitDataset(base, train_idx), SplitDataset(base, val_idx), base.classes,
+                lambda x: train_augment(x, args.img_size, in_channels=in_channels),
+                lambda x: val_transform(x, args.img_size, in_channels))
+
+    from tensor_cache import open_source
+
+    base = open_source(args.data)
+    train_idx, val_idx = split_indices(len(base), args.val_split, args.seed)
+    return (SplitDataset(base, train_idx, make_train_transforms(args.img_size, in_channels)),
+            SplitDataset(base, val_idx, make_transforms(args.img_size, in_channels)),
+            base.classes, None, None)
+
+
+def amp_dtype(device: torch.device, amp: str) -> Optional[torch.dtype]:
+    """float16 autocast on CUDA, bfloat16 on CPUs with native bf16 support, none otherwise."""
+    if amp == "off":
+        return None
+    if device.type == "cuda":
+        return torch.float16
+    if device.type == "cpu" and (amp == "on" or torch.ops.mkldnn._is_mkldnn_bf16_supported()):
+        return torch.bfloat16
+    return None
+
+
+def set_backbone_requires_grad(model: nn.Module, req: bool):
+    for name, p in model.named_parameters():
+        p.requires_grad = req or name.startswith("fc")
+
+
+def run_epoch(model: nn.Module, loader, device: torch.device, criterion: nn.Module,
+              optimizer: Optional[optim.Optimizer] = None, scaler=None, dtype: Optional[torch.dtype] = None,
+              channels_last: bool = False, gpu_transform: Optional[Callable] = None,
+              accum_steps: int = 1) -> Dict[str, float]:
+    """One pass over loader, training if an optimizer is given, stepping every accum_steps batches.
+    Besides loss and accuracy, returns images/sec, the host time spent waiting on the loader and
+    the compute time (GPU time from CUDA events on CUDA). Under DDP the stats cover all ranks."""
+    train = optimizer is not None
+    model.train(mode=train)
+    loss_sum = torch.zeros((), device=device)
+    correct = torch.zeros((), device=device, dtype=torch.long)
+    total, data_wait, compute = 0, 0.0, 0.0
+    autocast = torch.autocast(device.type, dtype=dtype) if dtype else nullcontext()
+    n_batches = len(loader)
+    if train:
+        optimizer.zero_grad(set_to_none=True)
+
+    # On CUDA the host runs ahead of the GPU, so compute is timed with events read once at the end
+    cuda = device.type == "cuda"
+    events = []
+    batches = iter(loader)
+    start = time.perf_counter()
+    for i in range(n_batches):
+        t0 = time.perf_counter()
+        images, targets = next(batches)
+        t1 = time.perf_counter()
+        data_wait += t1 - t0
+        if cuda:
+            events.append((torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)))
+            events[-1][0].record()
+
+        images = images.to(device, non_blocking=True)
+        targets = targets.to(device, non_blocking=True)
+        if gpu_transform is not None:
+            images = gpu_transform(images)
+        if channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+
+        step = (i + 1) % accum_steps == 0 or i + 1 == n_batches
+        # DDP all-reduces gradients on every backward unless told not to
+        no_sync = getattr(model, "no_sync", None)
+        with torch.set_grad_enabled(train), (no_sync() if train and not step and no_sync else nullcontext()):
+            with autocast:
+                outputs = model(images)
+                loss = criterion(outputs, targets)
+            if train:
+                scaled = loss / accum_steps
+                if scaler is not None:
+                    scaler.scale(scaled).backward()
+                else:
+                    scaled.backward()
+                if step:
+                    if scaler is not None:
+                        scaler.step(optimizer)
+                        scaler.update()
+                    else:
+                        optimizer.step()
+                    optimizer.zero_grad(set_to_none=True)
+
+        # Accumulate on the device; nothing in the loop waits for the GPU
+        loss_sum += loss.detach() * targets.size(0)
+        correct += (outputs.argmax(1) == targets).sum()
+        total += targets.size(0)
+        if cuda:
+            events[-1][1].record()
+        else:
+            compute += time.perf_counter() - t1
+
+    if cuda:
+        torch.cuda.synchronize()
+        compute = sum(s.elapsed_time(e) for s, e in events) / 1000
+    elapsed = time.perf_counter() - start
+    loss_sum, correct = loss_sum.item(), correct.item()
+    if dist.is_available() and dist.is_initialized():
+        sums = torch.tensor([loss_sum, correct, total, data_wait, compute], dtype=torch.float64)
+        longest = torch.tensor([elapsed], dtype=torch.float64)
+        if dist.get_backend() == "nccl":
+            sums, longest = sums.to(device), longest.to(device)
+        dist.all_reduce(sums)
+        dist.all_reduce(longest, op=dist.ReduceOp.MAX)
+        world = dist.get_world_size()
+        loss_sum, correct, total = sums[0].item(), sums[1].item(), int(sums[2].item())
+        data_wait, compute, elapsed = sums[3].item() / world, sums[4].item() / world, longest.item()
+    return {
+        "loss": loss_sum / max(total, 1),
+        "acc": correct / max(total, 1),
+        "images": total,
+        "seconds": elapsed,
+        "img_per_sec": total / max(elapsed, 1e-9),
+        "data_wait": data_wait,
+        "compute": compute,
+    }
+
+
+def format_stats(name: str, s: Dict[str, float]) -> str:
+    wait_pct = 100 * s["data_wait"] / max(s["seconds"], 1e-9)
+    return (f"{name} loss {s['loss']:.4f} acc {s['acc']:.3f} | {s['img_per_sec']:.0f} img/s, "
+            f"data wait {s['data_wait']:.1f}s ({wait_pct:.0f}%) compute {s['compute']:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the font classifier")
+    parser.add_argument("--data", type=Path, default=Path("data"), help="ImageFolder root or shard directory")
+    parser.add_argument("--cache", type=Path, default=None,
+                        help="Tensor cache directory (built from --data if stale); augments on the device")
+    parser.add_argument("--out-dir", type=Path, default=Path("runs/font_resnet"))
+    parser.add_argument("--epochs", type=int, default=12)
+    parser.add_argument("--frozen-epochs", type=int, default=3, help="Warmup epochs training only the fc head")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=3e-4)
+    parser.add_argument("--weight-decay", type=float, default=1e-4)
+    parser.add_argument("--val-split", type=float, default=0.15)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument("--channels", type=int, choices=[1, 3], default=3, help="Model input channels")
+    parser.add_argument("--no-pretrained", action="store_true", help="Start from random weights, not ImageNet")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1), help="DataLoader workers")
+    parser.add_argument("--prefetch", type=int, default=4, help="Batches prefetched per worker")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = default)")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--amp", choices=["auto", "on", "off"], default="auto",
+                        help="fp16 autocast on CUDA, bf16 on CPU (auto: only where the CPU supports bf16)")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the model")
+    parser.add_argument("--device", type=str, choices=["auto", "cpu", "cuda", "mps"], default="auto")
+    parser.add_argument("--accum-steps", type=int, default=1, help="Batches per optimizer step")
+    parser.add_argument("--render-online", action="store_true",
+                        help="Render training samples inside the DataLoader workers instead of reading --data")
+    parser.add_argument("--font-dir", type=str, default=None,
+                        help="With --render-online: local TTF/OTF fonts (Pillow) instead of Google Fonts (browser)")
+    parser.add_argument("--num-fonts", type=int, default=20, help="With --render-online: number of font classes")
+    parser.add_argument("--phrases", type=Path, default=Path("phrases_10000.csv"))
+    parser.add_argument("--samples-per-epoch", type=int, default=10000)
+    parser.add_argument("--val-samples", type=int, default=1500)
+    parser.add_argument("--shuffle-buffer", type=int, default=1024)
+    parser.add_argument("--render-group", type=int, default=16,
+                        help="Samples of one font rendered together (one page capture in the browser)")
+    parser.add_argument("--backend", choices=["auto", "gloo", "nccl"], default="auto",
+                        help="DDP backend when launched with torchrun (auto: nccl on CUDA, else gloo)")
+    args = parser.parse_args()
+
+    device = get_device() if args.device == "auto" else torch.device(args.device)
+    rank, world_size, local_rank = setup_distributed(device.type, args.backend)
+    if device.type == "cuda" and world_size > 1:
+        device = torch.device("cuda", local_rank)
+        torch.cuda.set_device(device)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    elif world_size > 1 and device.type == "cpu":
+        # Ranks on one node share its cores instead of each starting a full thread pool
+        local_world = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world))
+    torch.manual_seed(args.seed)
+    log = print if rank == 0 else (lambda *a, **k: None)
+
+    train_ds, val_ds, classes, train_gpu_tfm, val_gpu_tfm = build_datasets(args, args.channels, local_rank)
+    # Every rank derives the same split; validation indices are dealt out without padding
+    n_val = len(val_ds) * (world_size if isinstance(val_ds, IterableDataset) else 1)
+    if isinstance(val_ds, SplitDataset):
+        val_ds.indices = val_ds.indices[rank::world_size]
+    kwargs = loader_kwargs(args.workers, args.prefetch, device)
+    train_sampler = None
+    if world_size > 1 and not isinstance(train_ds, IterableDataset):
+        train_sampler = DistributedSampler(train_ds, world_size, rank, shuffle=True, seed=args.seed, drop_last=True)
+    train_loader = DataLoader(train_ds, batch_size=args.batch_size,
+                              shuffle=train_sampler is None and not isinstance(train_ds, IterableDataset),
+                              sampler=train_sampler, drop_last=True, **kwargs)
+    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, **kwargs)
+
+    if rank == 0:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        with open(args.out_dir / "classes.json", "w") as f:
+            json.dump(classes, f)
+
+    model = build_model(len(classes), args.channels, pretrained=not args.no_pretrained).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    def wrap(model: nn.Module) -> nn.Module:
+        # DDP only reduces parameters that require grad when it is built, so it is rebuilt on unfreeze
+        if world_size > 1:
+            model = DDP(model, device_ids=[device.index] if device.type == "cuda" else None)
+        return torch.compile(model) if args.compile else model
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.AdamW(model.parameters(), lr=args.lr, weight_decay=args.weight_decay)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs)
+    dtype = amp_dtype(device, args.amp)
+    scaler = torch.amp.GradScaler("cuda") if dtype == torch.float16 else None
+    log(f"Training on {device} x {world_size} | {len(train_ds)} train / {n_val} val | "
+        f"{len(classes)} classes | batch {args.batch_size} x {args.accum_steps} accum x {world_size} ranks | "
+        f"workers {args.workers} | autocast {dtype} | channels_last {args.channels_last} | compile {args.compile}")
+
+    best_val_acc = 0.0
+    best_ckpt = args.out_dir / "best.ckpt.pt"
+    set_backbone_requires_grad(model, args.frozen_epochs == 0)
+    net = wrap(model)
+    for epoch in range(args.epochs):
+        if epoch == args.frozen_epochs and epoch > 0:
+            set_backbone_requires_grad(model, True)
+            if world_size > 1:
+                net = wrap(model)
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
+        if isinstance(train_ds, IterableDataset):
+            train_ds.set_epoch(epoch)
+
+        train_stats = run_epoch(net, train_loader, device, criterion, optimizer, scaler, dtype,
+                                args.channels_last, train_gpu_tfm, args.accum_steps)
+        with torch.no_grad():
+            val_stats = run_epoch(net, val_loader, device, criterion, dtype=dtype,
+                                  channels_last=args.channels_last, gpu_transform=val_gpu_tfm)
+        scheduler.step()
+
+        prefix = f"Epoch {epoch + 1:02d}/{args.epochs} "
+        log(f"{prefix}| {format_stats('train', train_stats)}")
+        log(f"{'':{len(prefix)}s}| {format_stats('val', val_stats)}")
+
+        # Stats are reduced over all ranks, so every rank takes the same branch here
+        if val_stats["acc"] > best_val_acc:
+            best_val_acc = val_stats["acc"]
+            if rank == 0:
+                ckpt = {"model_state": model.state_dict(), "classes": classes, "val_acc": best_val_acc}
+                if args.channels == 1:
+                    ckpt["in_channels"] = 1
+                torch.save(ckpt, best_ckpt)
+                log(f"  Saved new best to {best_ckpt} (val_acc={best_val_acc:.3f})")
+        if rank == 0:
+            with open(args.out_dir / "metrics.jsonl", "a") as f:
+                f.write(json.dumps({"epoch": epoch + 1, "train": train_stats, "val": val_stats}) + "\n")
+
+    log(f"Best val acc: {best_val_acc:.3f}")
+    if world_size > 1:
+        dist.destroy_process_group()
+
+
+if __name__ == "__main__":
+    main()